@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from functools import partial
+import numpy as np
+import maths
+import heatmaps
+
+"""
+benchmarks for the bargaining solvers & heatmap fills, run with
+
+python benchmarks.py [--quick] [--output FILE] [--baseline FILE] [--save-baseline]
+
+each benchmark reports its wall time, the number of bargaining problems
+solved, solves per second & the number of welfare (objective) evaluations.
+results are written as json, and compared against a stored baseline:
+benchmarks that got slower or need more objective evaluations than
+the baseline by more than --tolerance are flagged as regressions.
+"""
+
+default_output_file = 'benchmark_results.json'
+default_baseline_file = 'benchmark_baseline.json'
+min_compared_seconds = 0.05 # wall times shorter than this (in the baseline) are too noisy to flag
+
+welfare_functions = {'nash': maths.nash_welfare_function,
+                     'ks': maths.ks_welfare_function}
+
+# ranges of m/(1-m) to benchmark single solves over
+m_ratio_ranges = {'low m': (1e-5, 1e-2),
+                  'mid m': (1e-2, 1e+2),
+                  'high m': (1e+2, 1e+5)}
+
+quantities = {'expected_utility_A': (maths.expected_utility_A,
+                                     maths.expected_utility_A_grid),
+              'expected_utility_A_shift_ratio': (maths.expected_utility_A_shift_ratio,
+                                                 maths.expected_utility_A_shift_ratio_grid),
+              'expected_utility_A_max_shift': (maths.expected_utility_A_max_shift,
+                                               maths.expected_utility_A_max_shift_grid)}
+
+
+def timed(benchmark: callable) -> dict:
+    """ runs benchmark() from a cold solution cache, returns its counts & timings """
+    maths.clear_solution_cache()
+    start = time.perf_counter()
+    with maths.instrumentation() as stats:
+        benchmark()
+    seconds = time.perf_counter() - start
+    maths.clear_solution_cache()
+    solves = maths.fresh_solves(stats)
+    return {'seconds': seconds,
+            'solves': solves,
+            'solves_per_second': solves / seconds,
+            'objective_evaluations': sum(record['points'] for record in stats['welfare_functions'].values()),
+            'gradient_evaluations': stats['solves']['gradient_evaluations'],
+            'iterations': stats['solves']['iterations'],
+            'unconverged': stats['solves']['unconverged']}
+##
+
+
+def _m_values(min_ratio, max_ratio, n_values):
+    m_ratios = np.power(10, np.linspace(np.log10(min_ratio), np.log10(max_ratio), n_values))
+    return m_ratios / (1 + m_ratios)
+##
+
+def _p_values(n_values):
+    return np.power(10, np.linspace(np.log10(heatmaps.min_p), np.log10(heatmaps.max_p), n_values))
+##
+
+
+#### benchmarks ####
+
+def benchmark_single_solves(n_m_values: int = 20) -> dict:
+    """ single find_bargaining_solution calls for each welfare function, outcome & range of m """
+    results = {}
+    for welfare_name, welfare_function in welfare_functions.items():
+        for outcome, (failure_utility_A, failure_utility_U) in maths.bargaining_failure_utilities.items():
+            for range_name, (min_ratio, max_ratio) in m_ratio_ranges.items():
+                m_values = _m_values(min_ratio, max_ratio, n_m_values)
+                def benchmark():
+                    for m in m_values:
+                        maths.find_bargaining_solution(m, welfare_function,
+                                                       failure_utility_A(m),
+                                                       failure_utility_U(m))
+                results[f'solve {welfare_name} outcome {outcome} {range_name}'] = timed(benchmark)
+    return results
+##
+
+
+def benchmark_heatmap_fills(resolutions: tuple = (8, 16, 32)) -> dict:
+    """ compute_heatmap_values for the default quantity, per cell & on the grid """
+    results = {}
+    # per cell stats would make grid fills go row by row
+    default_instrument_cells = heatmaps.instrument_cells
+    heatmaps.instrument_cells = False
+    try:
+        failure_utility_A, failure_utility_U = maths.bargaining_failure_utilities[0]
+        for welfare_name, welfare_function in welfare_functions.items():
+            for resolution in resolutions:
+                m_values = _m_values(heatmaps.min_m_ratio, heatmaps.max_m_ratio, resolution)
+                p_values = _p_values(resolution)
+                quantity_function, grid_quantity_function = quantities['expected_utility_A_max_shift']
+                for vectorized in (False, True):
+                    fill_func = partial(maths.log_quantity,
+                                        quantity_function = grid_quantity_function if vectorized else quantity_function,
+                                        welfare_function = welfare_function,
+                                        bargaining_failure_utility_A = failure_utility_A,
+                                        bargaining_failure_utility_U = failure_utility_U)
+                    benchmark = partial(heatmaps.compute_heatmap_values, fill_func,
+                                        m_values, p_values, vectorized = vectorized)
+                    mode = 'grid' if vectorized else 'per cell'
+                    results[f'heatmap {welfare_name} resolution {resolution} {mode}'] = timed(benchmark)
+    finally:
+        heatmaps.instrument_cells = default_instrument_cells
+    return results
+##
+
+
+def benchmark_quantities(n_points: int = 10) -> dict:
+    """ each of main.py's quantities for each welfare function & disagreement outcome """
+    results = {}
+    m_values = _m_values(heatmaps.min_m_ratio, heatmaps.max_m_ratio, n_points)
+    p_values = _p_values(n_points)
+    for quantity_name, (quantity_function, _) in quantities.items():
+        for welfare_name, welfare_function in welfare_functions.items():
+            for outcome, (failure_utility_A, failure_utility_U) in maths.bargaining_failure_utilities.items():
+                def benchmark():
+                    for m, p in zip(m_values, p_values):
+                        quantity_function(m, p, welfare_function,
+                                          failure_utility_A, failure_utility_U)
+                results[f'{quantity_name} {welfare_name} outcome {outcome}'] = timed(benchmark)
+    return results
+##
+
+
+def benchmark_gradients(n_m_values: int = 50) -> dict:
+    """ m sweeps of single solves with & without analytic gradients """
+    results = {}
+    m_values = _m_values(heatmaps.min_m_ratio, heatmaps.max_m_ratio, n_m_values)
+    default_use_analytic_gradients = maths.use_analytic_gradients
+    try:
+        for welfare_name, welfare_function in welfare_functions.items():
+            for outcome, (failure_utility_A, failure_utility_U) in maths.bargaining_failure_utilities.items():
+                for use_analytic_gradients in (False, True):
+                    maths.use_analytic_gradients = use_analytic_gradients
+                    def benchmark():
+                        for m in m_values:
+                            maths.find_bargaining_solution(m, welfare_function,
+                                                           failure_utility_A(m),
+                                                           failure_utility_U(m))
+                    gradients = 'analytic' if use_analytic_gradients else 'finite difference'
+                    results[f'gradients {welfare_name} outcome {outcome} {gradients}'] = timed(benchmark)
+    finally:
+        maths.use_analytic_gradients = default_use_analytic_gradients
+    return results
+##
+
+
+# code timed in a fresh interpreter by benchmark_imports, after importing numpy
+import_benchmarks = {'import maths': 'import maths',
+                     'import heatmaps': 'import heatmaps',
+                     'import sweep': 'import sweep',
+                     'import maths & first solve':
+                         'import maths; maths.find_bargaining_solution(0.5, maths.nash_welfare_function, 0., 0.)'}
+
+def benchmark_imports(repeats: int = 5) -> dict:
+    """
+    best of repeats wall times of importing the modules (& making a first solve),
+    each in a fresh interpreter as worker processes do, and whether that
+    imported matplotlib & scipy.optimize
+    """
+    results = {}
+    for name, code in import_benchmarks.items():
+        timing_code = ('import sys, time; import numpy; start = time.perf_counter(); '
+                       f'{code}; print(time.perf_counter() - start, '
+                       "'matplotlib' in sys.modules, 'scipy.optimize' in sys.modules)")
+        runs = [subprocess.run([sys.executable, '-c', timing_code], capture_output = True, text = True,
+                               check = True, cwd = os.path.dirname(os.path.abspath(__file__))).stdout.split()
+                for _ in range(repeats)]
+        results[name] = {'seconds': min(float(run[0]) for run in runs),
+                         'solves': 0,
+                         'solves_per_second': 0.,
+                         'objective_evaluations': 0,
+                         'imports_matplotlib': runs[0][1] == 'True',
+                         'imports_scipy_optimize': runs[0][2] == 'True'}
+    return results
+##
+
+
+def run_benchmarks(quick: bool = False) -> dict:
+    """ runs every benchmark, smaller versions of them if quick """
+    results = benchmark_imports(repeats = 2 if quick else 5)
+    results.update(benchmark_single_solves(n_m_values = 5 if quick else 20))
+    results.update(benchmark_heatmap_fills(resolutions = (8,) if quick else (8, 16, 32)))
+    results.update(benchmark_quantities(n_points = 3 if quick else 10))
+    results.update(benchmark_gradients(n_m_values = 10 if quick else 50))
+    return results
+##
+
+
+def find_regressions(results: dict,
+                     baseline: dict,
+                     tolerance: float) -> list:
+    """
+    returns a list of messages, one for each benchmark in both results & baseline
+    that is slower, or needs more objective evaluations, by more than tolerance
+    (as a fraction of the baseline).
+    wall times are only compared for benchmarks taking at least min_compared_seconds.
+    """
+    regressions = []
+    for name, counts in results.items():
+        if name not in baseline:
+            continue
+        for measure in ('seconds', 'objective_evaluations'):
+            if measure == 'seconds' and baseline[name][measure] < min_compared_seconds:
+                continue
+            if counts[measure] > baseline[name][measure] * (1 + tolerance):
+                regressions.append(f'{name}: {measure} {baseline[name][measure]:.4g} -> {counts[measure]:.4g}')
+    return regressions
+##
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'benchmark the bargaining solvers & heatmap fills')
+    parser.add_argument('--quick', action = 'store_true', help = 'run smaller versions of the benchmarks')
+    parser.add_argument('--output', default = default_output_file, help = 'json file to write results to')
+    parser.add_argument('--baseline', default = default_baseline_file, help = 'json file of baseline results')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'also save the results as the new baseline')
+    parser.add_argument('--tolerance', type = float, default = 0.25,
+                        help = 'fractional slow down allowed before flagging a regression')
+    args = parser.parse_args()
+
+    results = run_benchmarks(quick = args.quick)
+    report = {'python': sys.version.split()[0],
+              'platform': platform.platform(),
+              'numpy': np.__version__,
+              'quick': args.quick,
+              'benchmarks': results}
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent = 2, sort_keys = True)
+
+    for name, counts in results.items():
+        print(f'{name:60s} {counts["seconds"]:8.3f}s {counts["solves_per_second"]:10.1f} solves/s '
+              f'{counts["objective_evaluations"]:10d} objective evaluations')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent = 2, sort_keys = True)
+    else:
+        try:
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            print(f'no baseline at {args.baseline}, save one with --save-baseline')
+            sys.exit(0)
+        if baseline.get('quick') != args.quick:
+            print('baseline was run with a different --quick setting, not comparing')
+            sys.exit(0)
+        regressions = find_regressions(results, baseline['benchmarks'], args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions else 0)
@@ -1,14 +1,35 @@
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import time
 from typing import Callable
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-import matplotlib.colors as colors
+import warnings
 import numpy as np
+import maths
+
+"""
+matplotlib is only imported by the functions that draw heatmaps, so computing
+heatmap values (e.g. in worker processes) does not pay for importing it.
+
+heatmaps are drawn on their own matplotlib Figure rather than pyplot's global
+figure (pyplot is only used to show them), so drawing many heatmaps in one
+process, or without a display, neither needs a gui backend nor keeps old figures
+in memory.
+"""
 
 resolution = 12
 save_heatmap = True
 show_heatmap = False
 result_file = 'bargaining_heatmap.png'
+max_tick_labels = 6 # most tick labels drawn on each axis, the labels in between are skipped
+direct_image = False # True = save heatmaps straight to png as an image array, one pixel per cell
+                     # (no title, axes or colorbar), much faster for very large grids, see save_heatmap_image
+
+streaming_block_rows = 4 # rows per task of vectorized streaming fills, written to the checkpoint together
+progress_file = 'bargaining_heatmap_progress.png'
+
+adaptive_initial_step = 8 # spacing (in grid points) of the coarse grid adaptive refinement starts from
+adaptive_tolerance = 0.1 # adaptive refinement subdivides cells whose corner values differ by more than this
+instrument_cells = True # record per cell stats while maths.instrumentation() is active, see compute_heatmap_values
 
 min_m_ratio = 10 ** -5 # minimum of m/(1-m)
 max_m_ratio = 10 ** +5 # maximum of m/(1-m)
@@ -19,13 +40,28 @@ def make_heatmap(fill_func: Callable,
                  cmap_type: str,
                  plot_title: str = None,
                  m_values: list = None,
-                 p_values: list = None) -> None:
+                 p_values: list = None,
+                 vectorized: bool = False,
+                 workers: int = 1,
+                 adaptive: bool = False) -> None:
     """
     evaluates val_func (a function taking in (m, p))
     at each pair of m, p values in a mesh made from
     m_values and p_values.
 
+    if vectorized, fill_func instead takes in (m_values, p_values)
+    and returns the whole len(m_values) * len(p_values) array at once.
+
+    if workers > 1, rows (m values) are spread across that many
+    processes, so fill_func must be picklable (e.g. a module level
+    function or a functools.partial of one).
+
+    if adaptive, only part of the mesh is evaluated & the rest is
+    interpolated, see compute_heatmap_values_adaptive.
+
     draws heatmap of results against m/(1-m) / p/(1-p).
+    if a maths.instrumentation() context is active, cells whose
+    bargaining solutions did not converge are marked.
 
     If m/p_values are none,
     use some sensible default values.
@@ -36,27 +72,370 @@ def make_heatmap(fill_func: Callable,
         p_values = default_p_values(min_p, max_p)
 
     # compute fill values
-    vals = np.array([[fill_func(m, p) for p in p_values]
-                     for m in m_values])
+    if adaptive:
+        vals = compute_heatmap_values_adaptive(fill_func, m_values, p_values,
+                                               vectorized = vectorized,
+                                               workers = workers)
+    else:
+        vals = compute_heatmap_values(fill_func, m_values, p_values,
+                                      vectorized = vectorized,
+                                      workers = workers)
+
+    unconverged_cells = None
+    stats = maths.instrumentation_stats()
+    if stats is not None and instrument_cells:
+        unconverged_cells = stats['heatmaps'][-1]['unconverged'] > 0
 
+    plot_heatmap(vals, m_values, p_values, cmap_type, plot_title,
+                 unconverged_cells = unconverged_cells)
+
+def plot_heatmap(vals: np.array,
+                 m_values: list,
+                 p_values: list,
+                 cmap_type: str,
+                 plot_title: str = None,
+                 unconverged_cells: np.array = None,
+                 file_name: str = None) -> None:
+    """
+    draws heatmap of vals (a len(m_values) * len(p_values) array,
+    e.g. from compute_heatmap_values) against m/(1-m) / p/(1-p).
+
+    unconverged_cells is an optional boolean array the shape of vals,
+    cells where it is True are marked with an x (& a warning is raised).
+    if file_name is given, the heatmap is only saved there.
+    if direct_image, the grid is saved as a plain image, see save_heatmap_image.
+    """
     # make axis values
-    x_values = p_values
-    y_values = [m/(1-m) for m in m_values]
+    x_values = np.asarray(p_values)
+    y_values = np.asarray(m_values) / (1 - np.asarray(m_values))
 
-    x_labels = ['10^{:.1f}'.format(np.log10(v)) for v in x_values]
-    y_labels = ['10^{:.1f}'.format(np.log10(v)) for v in y_values]
-    x_labels[::2] = ['' for _ in x_labels[::2]]
-    y_labels[::2] = ['' for _ in y_labels[::2]]
+    x_labels = ['10^{:.1f}'.format(v) for v in np.log10(x_values)]
+    y_labels = ['10^{:.1f}'.format(v) for v in np.log10(y_values)]
 
     # reverse y-axis so "up means bigger"
     y_labels.reverse()
     vals = np.flip(vals, axis = 0)
+    if unconverged_cells is not None:
+        unconverged_cells = np.flip(unconverged_cells, axis = 0)
+        if np.any(unconverged_cells):
+            warnings.warn(f'{np.count_nonzero(unconverged_cells)} heatmap cells depend on '
+                          'bargaining solutions that did not converge, they are marked with an x')
+
+    if direct_image:
+        save_heatmap_image(vals, cmap_type,
+                           marked_cells = unconverged_cells,
+                           file_name = result_file if file_name is None else file_name)
+        return
 
     make_heatmap_generic(vals = vals,
                          x_labels = x_labels,
                          y_labels = y_labels,
                          plot_title = plot_title,
-                         cmap_type = cmap_type)
+                         cmap_type = cmap_type,
+                         marked_cells = unconverged_cells,
+                         file_name = file_name)
+
+def compute_heatmap_values(fill_func: Callable,
+                           m_values: list,
+                           p_values: list,
+                           vectorized: bool = False,
+                           workers: int = 1) -> np.array:
+    """
+    returns the len(m_values) * len(p_values) array of fill values,
+    see make_heatmap.
+
+    if a maths.instrumentation() context is active, the time taken, bargaining
+    problems solved & unconverged solutions used by each cell are appended
+    to its stats['heatmaps'] (unless instrument_cells is False). vectorized
+    fills are then done one row at a time, and all cells of a row share the
+    row's counts.
+    """
+    stats = maths.instrumentation_stats() if instrument_cells else None
+    fill_rows = _fill_rows if stats is None else _fill_rows_instrumented
+    if workers <= 1:
+        blocks = [fill_rows(fill_func, m_values, p_values, vectorized)]
+    else:
+        # one task per row, or one block of rows per worker if vectorized
+        n_tasks = workers if vectorized else len(m_values)
+        m_blocks = [block for block in np.array_split(np.asarray(m_values), n_tasks)
+                    if len(block) > 0]
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            blocks = list(executor.map(fill_rows,
+                                       [fill_func] * len(m_blocks),
+                                       m_blocks,
+                                       [p_values] * len(m_blocks),
+                                       [vectorized] * len(m_blocks)))
+    if stats is None:
+        return np.concatenate(blocks, axis = 0)
+
+    if workers > 1:
+        for block in blocks:
+            maths.merge_instrumentation_stats(stats, block[2])
+    cell_stats = {key: np.concatenate([block[1][key] for block in blocks], axis = 0)
+                  for key in blocks[0][1]}
+    stats['heatmaps'].append(dict(cell_stats, m_values = np.asarray(m_values),
+                                  p_values = np.asarray(p_values)))
+    return np.concatenate([block[0] for block in blocks], axis = 0)
+
+def _fill_rows(fill_func, m_values, p_values, vectorized):
+    if vectorized:
+        return np.asarray(fill_func(m_values, p_values))
+    return np.array([[fill_func(m, p) for p in p_values]
+                     for m in m_values])
+
+def _fill_rows_instrumented(fill_func, m_values, p_values, vectorized):
+    """
+    _fill_rows, but returns (vals, per cell stats, solver stats of the whole block),
+    where the per cell stats are arrays of the seconds, solves & unconverged solutions of each cell
+    """
+    shape = (len(m_values), len(p_values))
+    vals = np.empty(shape)
+    cell_stats = {key: np.zeros(shape) for key in ('seconds', 'solves', 'unconverged')}
+    with maths.instrumentation() as block_stats:
+        for i in range(len(m_values)):
+            for j in [slice(None)] if vectorized else range(len(p_values)):
+                start = time.perf_counter()
+                with maths.instrumentation() as stats:
+                    if vectorized:
+                        vals[i] = np.asarray(fill_func(m_values[i:i + 1], p_values))[0]
+                    else:
+                        vals[i, j] = fill_func(m_values[i], p_values[j])
+                cell_stats['seconds'][i, j] = (time.perf_counter() - start) / (len(p_values) if vectorized else 1)
+                cell_stats['solves'][i, j] = maths.fresh_solves(stats)
+                cell_stats['unconverged'][i, j] = stats['solves']['unconverged']
+    return vals, cell_stats, block_stats
+
+def compute_heatmap_values_streaming(fill_func: Callable,
+                                     m_values: list,
+                                     p_values: list,
+                                     vals: np.array,
+                                     done: np.array,
+                                     vectorized: bool = False,
+                                     workers: int = 1):
+    """
+    fills in the cells of vals (a len(m_values) * len(p_values) array)
+    that are not marked in done (a boolean array of the same shape),
+    marking them as they are written. yields the index of each row
+    (m value) as it completes, in order of completion.
+
+    vals & done are usually memory-mapped, e.g. from store.open_checkpoint,
+    in which case they are flushed to disk after each row, so an interrupted
+    computation can resume from the missing cells.
+
+    rows are one task each, or blocks of streaming_block_rows if vectorized.
+    records per cell stats of the cells filled like compute_heatmap_values.
+    """
+    m_values = np.asarray(m_values)
+    p_values = np.asarray(p_values)
+    missing_rows = [i for i in range(len(m_values)) if not np.all(done[i])]
+    if vectorized:
+        all_columns = list(range(len(p_values)))
+        tasks = [(missing_rows[k:k + streaming_block_rows], all_columns)
+                 for k in range(0, len(missing_rows), streaming_block_rows)]
+    else:
+        tasks = [([i], list(np.flatnonzero(~np.asarray(done[i])))) for i in missing_rows]
+
+    stats = maths.instrumentation_stats() if instrument_cells else None
+    fill_rows = _fill_rows if stats is None else _fill_rows_instrumented
+    if stats is not None:
+        cell_stats = {key: np.zeros(np.shape(vals)) for key in ('seconds', 'solves', 'unconverged')}
+
+    def write_block(rows, columns, block):
+        if stats is not None:
+            block, block_cell_stats, block_stats = block
+            for key, block_cell_values in block_cell_stats.items():
+                cell_stats[key][np.ix_(rows, columns)] = block_cell_values
+            if executor is not None:
+                maths.merge_instrumentation_stats(stats, block_stats)
+        # values first, so cells are only marked done once their values are on disk
+        vals[np.ix_(rows, columns)] = block
+        if isinstance(vals, np.memmap):
+            vals.flush()
+        done[np.ix_(rows, columns)] = True
+        if isinstance(done, np.memmap):
+            done.flush()
+
+    executor = ProcessPoolExecutor(max_workers = workers) if workers > 1 else None
+    try:
+        if executor is None:
+            for rows, columns in tasks:
+                write_block(rows, columns,
+                            fill_rows(fill_func, m_values[rows], p_values[columns], vectorized))
+                yield from rows
+        else:
+            futures = {executor.submit(fill_rows, fill_func, m_values[rows], p_values[columns], vectorized):
+                       (rows, columns) for rows, columns in tasks}
+            for future in as_completed(futures):
+                rows, columns = futures[future]
+                write_block(rows, columns, future.result())
+                yield from rows
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures = True)
+
+    if stats is not None:
+        stats['heatmaps'].append(dict(cell_stats, m_values = m_values, p_values = p_values))
+
+def save_progress_image(vals: np.array,
+                        done: np.array,
+                        m_values: list,
+                        p_values: list,
+                        cmap_type: str,
+                        plot_title: str = None,
+                        file_name: str = None) -> None:
+    """
+    saves a heatmap of the cells of vals marked in done to file_name
+    (progress_file if None), leaving the other cells blank
+    """
+    plot_heatmap(np.where(done, vals, np.nan), m_values, p_values, cmap_type,
+                 plot_title = plot_title,
+                 file_name = progress_file if file_name is None else file_name)
+
+def compute_heatmap_values_adaptive(fill_func: Callable,
+                                    m_values: list,
+                                    p_values: list,
+                                    vectorized: bool = False,
+                                    workers: int = 1,
+                                    tolerance: float = None,
+                                    initial_step: int = None) -> np.array:
+    """
+    returns the same array as compute_heatmap_values, but only evaluates
+    fill_func where the values change quickly.
+
+    starts from a coarse grid with initial_step points between evaluations,
+    then repeatedly splits cells into 4 where the values at the corners
+    differ by more than tolerance, change sign, or are partly undefined
+    (nan), until cells are 1 grid point wide. once a cell has been split,
+    its children are only split further if interpolating the parent cell
+    was off by more than tolerance at their corners, so smooth slopes are
+    not refined all the way down.
+
+    points inside cells that were not split are filled in by bilinear
+    interpolation of the corners, which is linear in log(m/(1-m)) & log(p)
+    for the default axes.
+
+    like compute_heatmap_values, records per cell stats if a maths.instrumentation()
+    context is active, interpolated cells have none.
+    """
+    if tolerance is None:
+        tolerance = adaptive_tolerance
+    if initial_step is None:
+        initial_step = adaptive_initial_step
+
+    m_values = np.asarray(m_values)
+    p_values = np.asarray(p_values)
+    vals = np.full((len(m_values), len(p_values)), np.nan)
+    evaluated = np.zeros(vals.shape, dtype = bool)
+    stats = maths.instrumentation_stats() if instrument_cells else None
+    cell_stats = None
+    if stats is not None:
+        cell_stats = {key: np.zeros(vals.shape) for key in ('seconds', 'solves', 'unconverged')}
+
+    m_edges = _coarse_edges(len(m_values), initial_step)
+    p_edges = _coarse_edges(len(p_values), initial_step)
+    # cells are (i0, i1, j0, j1, parent cell)
+    cells = [(i0, i1, j0, j1, None)
+             for i0, i1 in zip(m_edges[:-1], m_edges[1:])
+             for j0, j1 in zip(p_edges[:-1], p_edges[1:])]
+    finished_cells = []
+
+    executor = ProcessPoolExecutor(max_workers = workers) if workers > 1 else None
+    try:
+        while cells:
+            # evaluate all new corners of this level of cells together
+            corners = {(i, j) for i0, i1, j0, j1, _ in cells
+                       for i in (i0, i1) for j in (j0, j1)
+                       if not evaluated[i, j]}
+            _fill_points(fill_func, m_values, p_values, corners,
+                         vals, vectorized, executor, cell_stats)
+            for i, j in corners:
+                evaluated[i, j] = True
+
+            split_cells = []
+            for i0, i1, j0, j1, parent in cells:
+                can_split = i1 - i0 > 1 or j1 - j0 > 1
+                if can_split and _needs_refinement(vals, i0, i1, j0, j1, parent, tolerance):
+                    split_cells += [child + ((i0, i1, j0, j1),)
+                                    for child in _split_cell(i0, i1, j0, j1)]
+                else:
+                    finished_cells.append((i0, i1, j0, j1))
+            cells = split_cells
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for i0, i1, j0, j1 in finished_cells:
+        _interpolate_cell(vals, evaluated, i0, i1, j0, j1)
+    if stats is not None:
+        stats['heatmaps'].append(dict(cell_stats, m_values = m_values, p_values = p_values))
+    return vals
+
+def _coarse_edges(n_points, step):
+    """ indices 0, step, 2 * step ... always including the last index """
+    edges = list(range(0, n_points - 1, max(step, 1))) + [n_points - 1]
+    return edges if n_points > 1 else [0, 0]
+
+def _needs_refinement(vals, i0, i1, j0, j1, parent, tolerance):
+    corner_vals = vals[[i0, i0, i1, i1], [j0, j1, j0, j1]]
+    defined_vals = corner_vals[np.isfinite(corner_vals)]
+    if defined_vals.size < corner_vals.size:
+        return defined_vals.size > 0
+    max_val = np.amax(defined_vals)
+    min_val = np.amin(defined_vals)
+    if max_val - min_val <= tolerance:
+        return min_val < 0 < max_val
+    if min_val < 0 < max_val or parent is None:
+        return True
+
+    # corners differ, but only refine if they were not predictable from the parent
+    parent_vals = _bilinear(vals, *parent, np.array([i0, i1])[:, None], np.array([j0, j1])[None, :])
+    return np.amax(np.abs(parent_vals.ravel() - corner_vals)) > tolerance
+
+def _bilinear(vals, i0, i1, j0, j1, i, j):
+    """ bilinear interpolation at (i, j) of the values at the corners of cell (i0, i1, j0, j1) """
+    u = (i - i0) / max(i1 - i0, 1)
+    v = (j - j0) / max(j1 - j0, 1)
+    return (1 - u) * (1 - v) * vals[i0, j0] + (1 - u) * v * vals[i0, j1] + \
+        u * (1 - v) * vals[i1, j0] + u * v * vals[i1, j1]
+
+def _split_cell(i0, i1, j0, j1):
+    i_ranges = [(i0, (i0 + i1) // 2), ((i0 + i1) // 2, i1)] if i1 - i0 > 1 else [(i0, i1)]
+    j_ranges = [(j0, (j0 + j1) // 2), ((j0 + j1) // 2, j1)] if j1 - j0 > 1 else [(j0, j1)]
+    return [(a0, a1, b0, b1) for a0, a1 in i_ranges for b0, b1 in j_ranges]
+
+def _fill_points(fill_func, m_values, p_values, points, vals, vectorized, executor, cell_stats = None):
+    """
+    evaluates fill_func at each (i, j) in points, one task per m value.
+    if cell_stats is given, fills it in like _fill_rows_instrumented.
+    """
+    rows = {}
+    for i, j in sorted(points):
+        rows.setdefault(i, []).append(j)
+    row_indices = list(rows)
+    args = ([fill_func] * len(row_indices),
+            [m_values[i:i + 1] for i in row_indices],
+            [p_values[rows[i]] for i in row_indices],
+            [vectorized] * len(row_indices))
+    fill_rows = _fill_rows if cell_stats is None else _fill_rows_instrumented
+    row_vals = executor.map(fill_rows, *args) if executor is not None else map(fill_rows, *args)
+    for i, row in zip(row_indices, row_vals):
+        if cell_stats is None:
+            vals[i, rows[i]] = row[0]
+            continue
+        row, row_cell_stats, row_stats = row
+        vals[i, rows[i]] = row[0]
+        for key, row_cell_values in row_cell_stats.items():
+            cell_stats[key][i, rows[i]] = row_cell_values[0]
+        if executor is not None:
+            maths.merge_instrumentation_stats(maths.instrumentation_stats(), row_stats)
+
+def _interpolate_cell(vals, evaluated, i0, i1, j0, j1):
+    interpolated = _bilinear(vals, i0, i1, j0, j1,
+                             np.arange(i0, i1 + 1)[:, None],
+                             np.arange(j0, j1 + 1)[None, :])
+    cell_vals = vals[i0:i1 + 1, j0:j1 + 1]
+    cell_evaluated = evaluated[i0:i1 + 1, j0:j1 + 1]
+    cell_vals[~cell_evaluated] = interpolated[~cell_evaluated]
 
 def default_p_values(min_, max_):
     log_min = np.log10(min_)
@@ -77,33 +456,100 @@ def make_heatmap_generic(vals: np.array,
                          x_labels: np.array,
                          y_labels: np.array,
                          plot_title: str = None,
-                         cmap_type = 'sequential') -> None:
-    """ makes heatmap of vals (resolution * resolution array), labels
-    the axes with x_labels & y_labels
-    (each a 1d array of length 'resolution') """
-    if cmap_type == 'divergent':
-        max_val = np.amax(vals)
-        min_val = np.amin(vals)
-        divnorm = colors.TwoSlopeNorm(vmin = min_val, vcenter = 0, vmax = max_val)
-        cmap = cm.seismic
-    if cmap_type == 'sequential':
-        cmap = cm.hot
-        divnorm = None
-    
-    plt.imshow(vals, cmap = cmap, interpolation = 'nearest', norm = divnorm)
-    plt.xticks(np.arange(resolution), x_labels)
-    plt.yticks(np.arange(resolution), y_labels)
-    plt.colorbar()
-    plt.title(plot_title)
-
-    plt.xlabel('Prob(bargaining success)')
-    plt.ylabel('Ratio of bargaining powers (team aligned)/(team unaligned)')
-
-    axes = plt.gca()
-    axes.xaxis.label.set_size(9)
-    axes.yaxis.label.set_size(9)
+                         cmap_type = 'sequential',
+                         marked_cells: np.array = None,
+                         file_name: str = None) -> None:
+    """ makes heatmap of vals (a 2d array), labels the axes with
+    x_labels & y_labels (one per column & row of vals,
+    at most max_tick_labels of each are drawn),
+    and marks the cells where marked_cells (a boolean array like vals) is True.
+    saves it to file_name if given, otherwise as save/show_heatmap say. """
+    show = show_heatmap and file_name is None
+    figure = render_heatmap(vals, x_labels, y_labels, plot_title, cmap_type, marked_cells,
+                            pyplot_figure = show)
 
+    if file_name is not None:
+        figure.savefig(file_name)
+        return
     if save_heatmap:
-        plt.savefig(result_file)
-    if show_heatmap:
+        figure.savefig(result_file)
+    if show:
+        import matplotlib.pyplot as plt
         plt.show()
+        plt.close(figure)
+
+def render_heatmap(vals: np.array,
+                   x_labels: np.array,
+                   y_labels: np.array,
+                   plot_title: str = None,
+                   cmap_type = 'sequential',
+                   marked_cells: np.array = None,
+                   pyplot_figure: bool = False):
+    """
+    returns a matplotlib Figure of the heatmap make_heatmap_generic draws.
+    the figure is not known to pyplot (so is freed once unused & needs no
+    display) unless pyplot_figure, which is needed to show it.
+    """
+    if pyplot_figure:
+        import matplotlib.pyplot as plt
+        figure = plt.figure()
+    else:
+        from matplotlib.figure import Figure
+        figure = Figure()
+    axes = figure.add_subplot()
+
+    cmap, norm = _heatmap_colors(vals, cmap_type)
+    image = axes.imshow(vals, cmap = cmap, interpolation = 'nearest', norm = norm)
+    x_ticks = _thinned_ticks(len(x_labels))
+    y_ticks = _thinned_ticks(len(y_labels))
+    axes.set_xticks(x_ticks, [x_labels[k] for k in x_ticks])
+    axes.set_yticks(y_ticks, [y_labels[k] for k in y_ticks])
+    figure.colorbar(image, ax = axes)
+    if marked_cells is not None and np.any(marked_cells):
+        marked_rows, marked_columns = np.nonzero(marked_cells)
+        axes.scatter(marked_columns, marked_rows, marker = 'x', color = 'grey')
+    axes.set_title(plot_title)
+
+    axes.set_xlabel('Prob(bargaining success)', size = 9)
+    axes.set_ylabel('Ratio of bargaining powers (team aligned)/(team unaligned)', size = 9)
+    return figure
+
+def save_heatmap_image(vals: np.array,
+                       cmap_type = 'sequential',
+                       marked_cells: np.array = None,
+                       file_name: str = None) -> None:
+    """
+    saves vals (a 2d array, first row at the top) to file_name (result_file if None)
+    as a png with one pixel per cell, coloured as make_heatmap_generic would,
+    without axes. nan cells are transparent & marked cells grey.
+    """
+    from matplotlib.image import imsave
+    cmap, norm = _heatmap_colors(vals, cmap_type)
+    if norm is None:
+        from matplotlib.colors import Normalize
+        norm = Normalize(vmin = np.nanmin(vals), vmax = np.nanmax(vals))
+    # colour through the colormap's lookup table, cheaper than mapping floats for huge grids
+    colors = cmap(np.arange(cmap.N), bytes = True)
+    scaled = np.clip(np.nan_to_num(np.ma.filled(norm(vals), np.nan)) * cmap.N, 0, cmap.N - 1)
+    pixels = colors[scaled.astype(np.intp)]
+    pixels[np.isnan(vals)] = 0
+    if marked_cells is not None:
+        pixels[marked_cells] = (128, 128, 128, 255)
+    # light compression, most of the saving time otherwise
+    imsave(result_file if file_name is None else file_name, pixels,
+           pil_kwargs = {'compress_level': 1})
+
+def _heatmap_colors(vals, cmap_type):
+    """ the (colormap, norm) heatmaps of vals are drawn with """
+    import matplotlib.colors as colors
+    from matplotlib import colormaps
+    if cmap_type == 'divergent':
+        max_val = np.nanmax(vals)
+        min_val = np.nanmin(vals)
+        return colormaps['seismic'], colors.TwoSlopeNorm(vmin = min_val, vcenter = 0, vmax = max_val)
+    return colormaps['hot'], None
+
+def _thinned_ticks(n_labels):
+    """ positions of the (at most max_tick_labels) labels drawn on an axis of n_labels cells """
+    step = max(1, -(-n_labels // max_tick_labels))
+    return np.arange(n_labels - 1, -1, -step)[::-1]
@@ -1,6 +1,12 @@
 
+from contextlib import nullcontext
+from functools import partial
+import numpy as np
 from maths import *
 from heatmaps import *
+from store import finish_checkpoint, load_grid, open_checkpoint, save_grid
+
+# settings for a single heatmap, see sweep.py to compute grids for many settings at once
 
 quantity_to_plot = 'expected_utility_A_max_shift'
 # choices = 'expected_utility_A',
@@ -15,20 +21,53 @@ disagreement_outcome = 2
 #           1 (both get utility 0)
 #           2 (same as 1, swapped and * -1)
 
+grid_evaluation = True
+# True = solve each bargaining problem once per m and fill the whole p axis from it
+# False = evaluate every (m, p) cell independently
+
+heatmap_workers = 1
+# number of processes filling the heatmap, rows (m values) are spread across them
+
+adaptive_refinement = False
+# True = evaluate a coarse grid, refine only where values change quickly & interpolate the rest
+# (see adaptive_tolerance & adaptive_initial_step in heatmaps.py)
+
+results_directory = 'results'
+# computed grids are stored here & reused when the configuration is unchanged, None to always recompute
+
+checkpointing = True
+# True = write rows to a checkpoint in results_directory as they complete,
+# so an interrupted run resumes from the missing cells (not used with adaptive_refinement)
+
+progress_image_rows = 0
+# save a heatmap of the rows done so far to progress_file every this many rows, 0 = never
+
+server_address = None
+# 'host:port' (or a unix socket path) of a running server.py to compute the heatmap on,
+# sharing its cache of bargaining solutions with other clients, None = compute here
+# (needs grid_evaluation & no adaptive_refinement)
+
+instrument_solvers = False
+# True = count & time solves and welfare evaluations, print a report of them,
+# and mark cells whose bargaining solutions did not converge
+
 
 #### get function for quantity to plot  ####
 
 if quantity_to_plot == 'expected_utility_A':
     plot_title = 'log(expected payoff for team aligned)'
     plot_fill_function = expected_utility_A
+    plot_grid_fill_function = expected_utility_A_grid
     cmap_type = 'sequential'
 if quantity_to_plot == 'expected_utility_A_shift_ratio':
     plot_title = f'log(expected payoff gain from {delta * 100}% increase in p/(1-p) / m/(1-m))'
     plot_fill_function = expected_utility_A_shift_ratio
+    plot_grid_fill_function = expected_utility_A_shift_ratio_grid
     cmap_type = 'divergent'
 if quantity_to_plot == 'expected_utility_A_max_shift':
     plot_title = f'log(max expected payoff gain from {delta * 100}% change in p/(1-p) or m/(1-m))'
     plot_fill_function = expected_utility_A_max_shift
+    plot_grid_fill_function = expected_utility_A_max_shift_grid
     cmap_type = 'sequential'
 
 
@@ -40,44 +79,86 @@ if welfare_function == 'ks':
     welfare_func = ks_welfare_function
 
 #### decide bargaining failure outcomes ####
-    
-if disagreement_outcome == 0:
-    action_A = 1
-    action_U = 0
-    bargaining_failure_utility_A = \
-        lambda m: utility_A_from_actions(m,
-                                         action_A,
-                                         action_U)
-    bargaining_failure_utility_U = \
-        lambda m: utility_U_from_actions(m,
-                                         action_A,
-                                         action_U)
-    
-if disagreement_outcome == 1:
-    bargaining_failure_utility_A = lambda m: 0
-    bargaining_failure_utility_U = lambda m: 0
-
-if disagreement_outcome == 2:
-    action_A = 1
-    action_U = 0
-    bargaining_failure_utility_A = \
-        lambda m: - utility_U_from_actions(m,
-                                           action_A,
-                                           action_U)
-    bargaining_failure_utility_U = \
-        lambda m: - utility_A_from_actions(m,
-                                           action_A,
-                                           action_U)
+
+bargaining_failure_utility_A, bargaining_failure_utility_U = \
+    bargaining_failure_utilities[disagreement_outcome]
 
 #### make heatmap ####
 
-def heatmap_fill_func(m: float,
-                      p: float):
-    result = plot_fill_function(
-        m, p,
-        welfare_function = welfare_func,
-        bargaining_failure_utility_A = bargaining_failure_utility_A,
-        bargaining_failure_utility_U = bargaining_failure_utility_U)
-    return np.log(result)
+heatmap_fill_func = partial(
+    log_quantity,
+    quantity_function = plot_grid_fill_function if grid_evaluation else plot_fill_function,
+    welfare_function = welfare_func,
+    bargaining_failure_utility_A = bargaining_failure_utility_A,
+    bargaining_failure_utility_U = bargaining_failure_utility_U)
+
+# every input that changes the computed grid, but no plotting options
+heatmap_config = {'N': N,
+                  'delta': delta,
+                  'quantity_to_plot': quantity_to_plot,
+                  'welfare_function': welfare_function,
+                  'disagreement_outcome': disagreement_outcome,
+                  'grid_evaluation': grid_evaluation,
+                  'adaptive_refinement': adaptive_refinement,
+                  'adaptive_tolerance': adaptive_tolerance if adaptive_refinement else None,
+                  'adaptive_initial_step': adaptive_initial_step if adaptive_refinement else None,
+                  'resolution': resolution,
+                  'min_m_ratio': min_m_ratio,
+                  'max_m_ratio': max_m_ratio,
+                  'min_p': min_p,
+                  'max_p': max_p,
+                  'solver_settings': solver_settings()}
+
+if __name__ == '__main__':
+    stored_grid = None
+    if results_directory is not None:
+        stored_grid = load_grid(results_directory, heatmap_config)
+
+    unconverged_cells = None
+    if stored_grid is None:
+        m_values = default_m_values(min_m_ratio, max_m_ratio)
+        p_values = default_p_values(min_p, max_p)
+        with instrumentation() if instrument_solvers else nullcontext() as solver_stats:
+            if adaptive_refinement:
+                vals = compute_heatmap_values_adaptive(heatmap_fill_func, m_values, p_values,
+                                                       vectorized = grid_evaluation,
+                                                       workers = heatmap_workers)
+            elif server_address is not None or (checkpointing and results_directory is not None):
+                if checkpointing and results_directory is not None:
+                    vals, done = open_checkpoint(results_directory, heatmap_config, m_values, p_values)
+                else:
+                    vals = np.full((len(m_values), len(p_values)), np.nan)
+                    done = np.zeros((len(m_values), len(p_values)), dtype = bool)
+                if server_address is not None:
+                    from server import request_heatmap_values
+                    rows = request_heatmap_values(heatmap_config, vals, done, address = server_address)
+                else:
+                    rows = compute_heatmap_values_streaming(heatmap_fill_func, m_values, p_values, vals, done,
+                                                            vectorized = grid_evaluation,
+                                                            workers = heatmap_workers)
+                for rows_done, _ in enumerate(rows, 1):
+                    if progress_image_rows > 0 and rows_done % progress_image_rows == 0:
+                        save_progress_image(vals, done, m_values, p_values, cmap_type, plot_title)
+            else:
+                vals = compute_heatmap_values(heatmap_fill_func, m_values, p_values,
+                                              vectorized = grid_evaluation,
+                                              workers = heatmap_workers)
+        if solver_stats is not None:
+            print(instrumentation_report(solver_stats))
+            if solver_stats['heatmaps']:
+                unconverged_cells = solver_stats['heatmaps'][-1]['unconverged'] > 0
+        if results_directory is not None:
+            if checkpointing and not adaptive_refinement:
+                finished_grid = finish_checkpoint(results_directory, heatmap_config)
+                if finished_grid is None:
+                    print(f'heatmap incomplete, {np.count_nonzero(~done)} cells missing, '
+                          'run again to resume from the checkpoint')
+                else:
+                    vals, m_values, p_values = finished_grid
+            else:
+                save_grid(results_directory, heatmap_config, vals, m_values, p_values)
+    else:
+        vals, m_values, p_values = stored_grid
 
-make_heatmap(heatmap_fill_func, cmap_type, plot_title)
+    plot_heatmap(vals, m_values, p_values, cmap_type, plot_title,
+                 unconverged_cells = unconverged_cells)
@@ -1,7 +1,11 @@
 
-from math import log10
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from math import log, log10
+import time
+import warnings
 import numpy as np
-import scipy.optimize as optimizer
 from typing import Callable
 
 """
@@ -14,17 +18,63 @@ action_A = proportion of A's resources spent on X. 0 < action_A < 1
 action_U = proportion of U's resources spent on X. 0 < action_U < 1
 """
 
+optimizer = None # scipy.optimize, imported on the first numeric solve (see _minimize) to keep imports light
+
 N = 10 ** 22 # amount of resources avaliable to each team
 optimization_algo = 'L-BFGS-B' # algorithm for finding solutions to bargaining problems
+bargaining_solver = 'numeric' # default solver of find_bargaining_solution, 'numeric', 'multistart', 'frontier' or 'analytic'
+verify_analytic_solutions = False # cross-check analytic solutions against the numeric solver
+analytic_verification_tolerance = 1e-2 # max difference in utilities allowed by the cross-check
 initial_action_profile_guess = [0.1, 0.9]
+batch_method = 'grid_search' # how find_bargaining_solutions solves batches, 'grid_search', 'continuation', 'frontier' or 'analytic'
+batch_grid_points = 17 # points per axis in each round of the batched solver's grid search
+batch_tolerance = 1e-10 # batched solver stops once its search window is this small
+batch_max_rounds = 2000 # batched solver gives up refining after this many rounds
 delta = 0.01 # change in m or p to be depicted in heatmaps
+derivative_step = 1e-4 # step in log(m/(1-m)) of the central differences behind derivatives in m
+use_analytic_gradients = True # pass exact gradients (& hessians, for methods that use them) to the optimizer
+solution_cache_size = 2 ** 16 # max number of bargaining solutions kept in memory, 0 disables the cache
+solution_cache_tolerance = 1e-12 # m & failure utilities closer than this share a cached solution
 
 #### utilities given action profiles ####
 
+"""
+the *_array functions take numpy arrays (or scalars) of m and actions,
+broadcast them against each other and return arrays.
+the functions without the suffix take floats & are plain python, as they
+are called on every objective evaluation of the numeric solver.
+"""
+
+def specialLog_array(x: np.ndarray) -> np.ndarray:
+    """ log10(x) where x >= 1, 0 elsewhere """
+    x = np.asarray(x, dtype = float)
+    return np.log10(x, out = np.zeros_like(x), where = x >= 1)
+##
+
 def specialLog(x):
     return 0 if x < 1 else log10(x)
 ##
 
+def utility_A_from_actions_array(m: np.ndarray,
+                                 action_A: np.ndarray,
+                                 action_U: np.ndarray) -> np.ndarray:
+    """ array version of utility_A_from_actions """
+    m = np.asarray(m, dtype = float)
+    action_A = np.asarray(action_A, dtype = float)
+    action_U = np.asarray(action_U, dtype = float)
+    return m * specialLog_array(N * action_A) + (1 - m) * specialLog_array(N * action_U)
+##
+
+def utility_U_from_actions_array(m: np.ndarray,
+                                 action_A: np.ndarray,
+                                 action_U: np.ndarray) -> np.ndarray:
+    """ array version of utility_U_from_actions """
+    m = np.asarray(m, dtype = float)
+    action_A = np.asarray(action_A, dtype = float)
+    action_U = np.asarray(action_U, dtype = float)
+    return m * specialLog_array(N * (1 - action_A)) + (1 - m) * specialLog_array(N * (1 - action_U))
+##
+
 def utility_A_from_actions(m: float,
                            action_A: float,
                            action_U: float) -> float:
@@ -46,8 +96,75 @@ def utility_U_from_actions(m: float,
     return m * specialLog(N * (1 - action_A)) + (1 - m) * specialLog(N * (1 - action_U))
 ##
 
+#### bargaining failure (disagreement) outcomes ####
+
+"""
+each disagreement outcome is a pair of functions of m giving the utilities
+of team aligned & team unaligned when bargaining fails.
+to add a new outcome, define the pair at module level (so it can be sent
+to worker processes) & add it to bargaining_failure_utilities.
+"""
+
+def aligned_all_on_X_failure_utility_A(m: float) -> float:
+    """ aligned spends all on X, unaligned spends all on Y """
+    return utility_A_from_actions(m, action_A = 1, action_U = 0)
+##
+
+def aligned_all_on_X_failure_utility_U(m: float) -> float:
+    return utility_U_from_actions(m, action_A = 1, action_U = 0)
+##
+
+def zero_failure_utility(m: float) -> float:
+    """ both teams get utility 0 """
+    return 0
+##
+
+def swapped_negated_failure_utility_A(m: float) -> float:
+    """ same as aligned_all_on_X, with the utilities swapped and * -1 """
+    return - utility_U_from_actions(m, action_A = 1, action_U = 0)
+##
+
+def swapped_negated_failure_utility_U(m: float) -> float:
+    return - utility_A_from_actions(m, action_A = 1, action_U = 0)
+##
+
+# disagreement outcome number -> (bargaining_failure_utility_A, bargaining_failure_utility_U)
+bargaining_failure_utilities = {
+    0: (aligned_all_on_X_failure_utility_A, aligned_all_on_X_failure_utility_U),
+    1: (zero_failure_utility, zero_failure_utility),
+    2: (swapped_negated_failure_utility_A, swapped_negated_failure_utility_U),
+}
+
+
 #### welfare functions ####
 
+def ks_ideal_point(m: float) -> tuple:
+    """
+    returns (best_utility_A, best_utility_U), the best payoffs each team
+    could get if it chose both actions, used by the KS welfare function.
+
+    the utilities are separable & each log term is increasing in its own
+    action, so the maximum is found in closed form:
+    best for A at (action_A, action_U) = (1, 1), best for U at (0, 0).
+    both are log10(N) whatever m is, so results are cached per N only.
+    """
+    return _ks_ideal_point(N)
+##
+
+def ks_ideal_point_array(m: np.ndarray) -> tuple:
+    """ array version of ks_ideal_point, returns a tuple of 2 arrays shaped like m """
+    best_utility_A, best_utility_U = _ks_ideal_point(N)
+    m = np.asarray(m, dtype = float)
+    return np.full(m.shape, best_utility_A), np.full(m.shape, best_utility_U)
+##
+
+@lru_cache(maxsize = None)
+def _ks_ideal_point(N: float) -> tuple:
+    best_utility = specialLog(N)
+    return best_utility, best_utility
+##
+
+
 def nash_welfare_function(m: float,
                           action_A: float,
                           action_U: float,
@@ -81,31 +198,11 @@ def ks_welfare_function(m: float,
     the ks constraint is
     (u1 - d1)/(u2 - d2) = (b1 - d1)/(b2 - d2)
     where u1/2 are the two utilities, d1/2 are the failure payoffs,
-    and b1/2 are the best possible payoffs.
+    and b1/2 are the best possible payoffs (see ks_ideal_point).
     this equation is satisfied when 
     - ((u1 - d1)(b2 - d2) - (b1 - d1)(u2 - d2))^2 is maximized.
     """
-    def utility_A_moreargs(m, action_A, action_U, **extras):
-        return utility_A_from_actions(m, action_A, action_U)
-    best_action_profile_for_A = \
-        find_bargaining_solution(m = m,
-                                 welfare_function = utility_A_moreargs,
-                                 bargaining_failure_utility_A = 0,
-                                 bargaining_failure_utility_U = 0)
-    best_utility_A = utility_A_from_actions(m = m,
-                                            action_A = best_action_profile_for_A[0],
-                                            action_U = best_action_profile_for_A[1])
-
-    def utility_U_moreargs(m, action_A, action_U, **extras):
-        return utility_U_from_actions(m, action_A, action_U)
-    best_action_profile_for_U = find_bargaining_solution(
-        m = m,
-        welfare_function = utility_U_moreargs,
-        bargaining_failure_utility_A = 0,
-        bargaining_failure_utility_U = 0)
-    best_utility_U = utility_U_from_actions(m = m,
-                                            action_A = best_action_profile_for_U[0],
-                                            action_U = best_action_profile_for_U[1])
+    best_utility_A, best_utility_U = ks_ideal_point(m)
 
     utility_A = utility_A_from_actions(m, action_A, action_U)
     utility_U = utility_U_from_actions(m, action_A, action_U)
@@ -118,61 +215,1244 @@ def ks_welfare_function(m: float,
         (utility_U - bargaining_failure_utility_U)
     line_constraint = - (line_constraint_lhs - line_constraint_rhs) ** 2
 
-    pareto_constraint = - (utility_A + utility_U)
+    pareto_constraint = utility_A + utility_U
     return line_constraint + pareto_constraint
 ##
 
 
+def nash_welfare_function_array(m: np.ndarray,
+                                action_A: np.ndarray,
+                                action_U: np.ndarray,
+                                bargaining_failure_utility_A: np.ndarray,
+                                bargaining_failure_utility_U: np.ndarray) -> np.ndarray:
+    """ array version of nash_welfare_function """
+    return (utility_A_from_actions_array(m, action_A, action_U) - bargaining_failure_utility_A) * \
+        (utility_U_from_actions_array(m, action_A, action_U) - bargaining_failure_utility_U)
+##
+
+
+def ks_welfare_function_array(m: np.ndarray,
+                              action_A: np.ndarray,
+                              action_U: np.ndarray,
+                              bargaining_failure_utility_A: np.ndarray,
+                              bargaining_failure_utility_U: np.ndarray) -> np.ndarray:
+    """ array version of ks_welfare_function """
+    best_utility_A, best_utility_U = ks_ideal_point_array(m)
+
+    utility_A = utility_A_from_actions_array(m, action_A, action_U)
+    utility_U = utility_U_from_actions_array(m, action_A, action_U)
+
+    line_constraint_lhs = \
+        (utility_A - bargaining_failure_utility_A) * \
+        (best_utility_U - bargaining_failure_utility_U)
+    line_constraint_rhs = \
+        (best_utility_A - bargaining_failure_utility_A) * \
+        (utility_U - bargaining_failure_utility_U)
+    line_constraint = - (line_constraint_lhs - line_constraint_rhs) ** 2
+
+    pareto_constraint = utility_A + utility_U
+    return line_constraint + pareto_constraint
+##
+
+
+#### gradients & hessians ####
+
+"""
+exact derivatives with respect to the action profile (action_A, action_U).
+these work on floats & arrays: gradients have shape (2, ...) and hessians
+(2, 2, ...), where ... is the broadcast shape of the arguments.
+"""
+
+def _specialLog_derivatives(x):
+    """ returns the first & second derivatives of specialLog(N * x) with respect to x """
+    x = np.asarray(x, dtype = float)
+    inside = N * x >= 1
+    safe_x = np.where(inside, x, 1.)
+    first = np.where(inside, 1 / (safe_x * np.log(10)), 0.)
+    second = np.where(inside, - 1 / (safe_x ** 2 * np.log(10)), 0.)
+    return first, second
+##
+
+def _utility_derivatives(m, action_A, action_U):
+    """
+    returns (gradient_A, hessian_A, gradient_U, hessian_U),
+    the derivatives of utility_A & utility_U
+    """
+    m, action_A, action_U = np.broadcast_arrays(np.asarray(m, dtype = float),
+                                                np.asarray(action_A, dtype = float),
+                                                np.asarray(action_U, dtype = float))
+    first_A, second_A = _specialLog_derivatives(action_A)
+    first_U, second_U = _specialLog_derivatives(action_U)
+    first_not_A, second_not_A = _specialLog_derivatives(1 - action_A)
+    first_not_U, second_not_U = _specialLog_derivatives(1 - action_U)
+    zeros = np.zeros_like(m)
+
+    gradient_A = np.stack([m * first_A, (1 - m) * first_U])
+    gradient_U = np.stack([- m * first_not_A, - (1 - m) * first_not_U])
+    # both utilities are separable, so their hessians are diagonal
+    hessian_A = np.stack([np.stack([m * second_A, zeros]),
+                          np.stack([zeros, (1 - m) * second_U])])
+    hessian_U = np.stack([np.stack([m * second_not_A, zeros]),
+                          np.stack([zeros, (1 - m) * second_not_U])])
+    return gradient_A, hessian_A, gradient_U, hessian_U
+##
+
+def _outer(x, y):
+    """ outer product of two gradients, over their leading axis """
+    return x[:, None] * y[None, :]
+##
+
+
+def utility_A_gradient(m, action_A, action_U):
+    """ gradient of utility_A_from_actions """
+    gradient_A, _, _, _ = _utility_derivatives(m, action_A, action_U)
+    return gradient_A
+##
+
+def utility_U_gradient(m, action_A, action_U):
+    """ gradient of utility_U_from_actions """
+    _, _, gradient_U, _ = _utility_derivatives(m, action_A, action_U)
+    return gradient_U
+##
+
+
+def nash_welfare_gradient(m, action_A, action_U,
+                          bargaining_failure_utility_A,
+                          bargaining_failure_utility_U):
+    """ gradient of nash_welfare_function """
+    gradient_A, _, gradient_U, _ = _utility_derivatives(m, action_A, action_U)
+    surplus_A = utility_A_from_actions_array(m, action_A, action_U) - bargaining_failure_utility_A
+    surplus_U = utility_U_from_actions_array(m, action_A, action_U) - bargaining_failure_utility_U
+    return gradient_A * surplus_U + surplus_A * gradient_U
+##
+
+def nash_welfare_hessian(m, action_A, action_U,
+                         bargaining_failure_utility_A,
+                         bargaining_failure_utility_U):
+    """ hessian of nash_welfare_function """
+    gradient_A, hessian_A, gradient_U, hessian_U = _utility_derivatives(m, action_A, action_U)
+    surplus_A = utility_A_from_actions_array(m, action_A, action_U) - bargaining_failure_utility_A
+    surplus_U = utility_U_from_actions_array(m, action_A, action_U) - bargaining_failure_utility_U
+    return hessian_A * surplus_U + _outer(gradient_A, gradient_U) + \
+        _outer(gradient_U, gradient_A) + surplus_A * hessian_U
+##
+
+
+def _ks_line_constraint(m, action_A, action_U,
+                        bargaining_failure_utility_A,
+                        bargaining_failure_utility_U):
+    """
+    returns the KS line term before squaring, (u1 - d1)(b2 - d2) - (b1 - d1)(u2 - d2),
+    & the weights of utility_A & utility_U in it
+    """
+    best_utility_A, best_utility_U = ks_ideal_point_array(m)
+    weight_A = best_utility_U - bargaining_failure_utility_U
+    weight_U = - (best_utility_A - bargaining_failure_utility_A)
+    line = (utility_A_from_actions_array(m, action_A, action_U) - bargaining_failure_utility_A) * weight_A + \
+        (utility_U_from_actions_array(m, action_A, action_U) - bargaining_failure_utility_U) * weight_U
+    return line, weight_A, weight_U
+##
+
+def ks_welfare_gradient(m, action_A, action_U,
+                        bargaining_failure_utility_A,
+                        bargaining_failure_utility_U):
+    """ gradient of ks_welfare_function """
+    gradient_A, _, gradient_U, _ = _utility_derivatives(m, action_A, action_U)
+    line, weight_A, weight_U = _ks_line_constraint(m, action_A, action_U,
+                                                   bargaining_failure_utility_A,
+                                                   bargaining_failure_utility_U)
+    line_gradient = weight_A * gradient_A + weight_U * gradient_U
+    return - 2 * line * line_gradient + gradient_A + gradient_U
+##
+
+def ks_welfare_hessian(m, action_A, action_U,
+                       bargaining_failure_utility_A,
+                       bargaining_failure_utility_U):
+    """ hessian of ks_welfare_function """
+    gradient_A, hessian_A, gradient_U, hessian_U = _utility_derivatives(m, action_A, action_U)
+    line, weight_A, weight_U = _ks_line_constraint(m, action_A, action_U,
+                                                   bargaining_failure_utility_A,
+                                                   bargaining_failure_utility_U)
+    line_gradient = weight_A * gradient_A + weight_U * gradient_U
+    line_hessian = weight_A * hessian_A + weight_U * hessian_U
+    return - 2 * (_outer(line_gradient, line_gradient) + line * line_hessian) + \
+        hessian_A + hessian_U
+##
+
+
+def _specialLog_derivative(x):
+    """ plain python first derivative of specialLog(N * x), for floats """
+    return 1 / (x * log(10)) if N * x >= 1 else 0.
+##
+
+def _utility_gradients(m, action_A, action_U):
+    """ plain python (gradient_A, gradient_U) for floats, each a tuple of 2 floats """
+    gradient_A = (m * _specialLog_derivative(action_A), (1 - m) * _specialLog_derivative(action_U))
+    gradient_U = (- m * _specialLog_derivative(1 - action_A), - (1 - m) * _specialLog_derivative(1 - action_U))
+    return gradient_A, gradient_U
+##
+
+def _nash_welfare_gradient_scalar(m, action_A, action_U,
+                                  bargaining_failure_utility_A,
+                                  bargaining_failure_utility_U):
+    """ nash_welfare_gradient for floats, without numpy dispatch on the optimizer's hot path """
+    gradient_A, gradient_U = _utility_gradients(m, action_A, action_U)
+    surplus_A = utility_A_from_actions(m, action_A, action_U) - bargaining_failure_utility_A
+    surplus_U = utility_U_from_actions(m, action_A, action_U) - bargaining_failure_utility_U
+    return np.array([gradient_A[k] * surplus_U + surplus_A * gradient_U[k] for k in (0, 1)])
+##
+
+def _ks_welfare_gradient_scalar(m, action_A, action_U,
+                                bargaining_failure_utility_A,
+                                bargaining_failure_utility_U):
+    """ ks_welfare_gradient for floats, without numpy dispatch on the optimizer's hot path """
+    gradient_A, gradient_U = _utility_gradients(m, action_A, action_U)
+    best_utility_A, best_utility_U = ks_ideal_point(m)
+    weight_A = best_utility_U - bargaining_failure_utility_U
+    weight_U = - (best_utility_A - bargaining_failure_utility_A)
+    line = (utility_A_from_actions(m, action_A, action_U) - bargaining_failure_utility_A) * weight_A + \
+        (utility_U_from_actions(m, action_A, action_U) - bargaining_failure_utility_U) * weight_U
+    return np.array([- 2 * line * (weight_A * gradient_A[k] + weight_U * gradient_U[k]) +
+                     gradient_A[k] + gradient_U[k] for k in (0, 1)])
+##
+
+
+# exact derivatives of welfare functions, used by find_bargaining_solution when available
+welfare_function_gradients = {nash_welfare_function: nash_welfare_gradient,
+                              ks_welfare_function: ks_welfare_gradient}
+# versions of them for single action profiles, preferred by the numeric solver
+_scalar_welfare_function_gradients = {nash_welfare_function: _nash_welfare_gradient_scalar,
+                                      ks_welfare_function: _ks_welfare_gradient_scalar}
+welfare_function_hessians = {nash_welfare_function: nash_welfare_hessian,
+                             ks_welfare_function: ks_welfare_hessian}
+
+# scipy.optimize.minimize methods that make use of a hessian
+hessian_methods = ('Newton-CG', 'dogleg', 'trust-ncg', 'trust-krylov', 'trust-exact', 'trust-constr')
+
+
+#### analytic bargaining solutions ####
+
+"""
+for 0 <= m <= 1 the utilities are weighted sums of concave logs, so
+any action profile is weakly pareto dominated by (t, t) with
+t = m * action_A + (1 - m) * action_U. the pareto frontier is therefore
+the diagonal action_A = action_U = t, along which
+
+utility_A = specialLog(N * t),  utility_U = specialLog(N * (1 - t))
+
+independent of m. the nash & ks solutions are then 1d root finding
+problems along t, solved here by vectorized bisection in log(t/(1-t)).
+"""
+
+analytic_bisection_steps = 64
+
+def analytic_bargaining_solutions(m_array: np.ndarray,
+                                  welfare_function: Callable,
+                                  bargaining_failure_utility_A_array: np.ndarray,
+                                  bargaining_failure_utility_U_array: np.ndarray) -> tuple:
+    """
+    returns (solutions, solved): an (n, 2) array of the nash or ks
+    bargaining solutions found along the pareto frontier, & a boolean
+    array marking the problems this applies to.
+
+    problems are not solved (& their rows are nan) if welfare_function is not
+    one of the built in welfare functions, m is outside [0, 1], or
+    the failure utilities leave no frontier point where both teams gain.
+    """
+    m_array, failure_utility_A, failure_utility_U = \
+        np.broadcast_arrays(np.atleast_1d(np.asarray(m_array, dtype = float)),
+                            np.asarray(bargaining_failure_utility_A_array, dtype = float),
+                            np.asarray(bargaining_failure_utility_U_array, dtype = float))
+    solutions = np.full((m_array.size, 2), np.nan)
+    solved = np.zeros(m_array.size, dtype = bool)
+    if welfare_function in (nash_welfare_function, nash_welfare_function_array):
+        is_nash = True
+    elif welfare_function in (ks_welfare_function, ks_welfare_function_array):
+        is_nash = False
+    else:
+        return solutions, solved
+
+    frontier_utilities = lambda t, one_minus_t: (specialLog_array(N * t),
+                                                 specialLog_array(N * one_minus_t))
+    if not is_nash:
+        best_utility_A, best_utility_U = ks_ideal_point_array(m_array)
+
+    # bisect on s = log10(t/(1-t)), so both ends of the frontier are resolved
+    log_N = np.log10(float(N))
+    lower = np.full(m_array.size, - log_N - 1)
+    upper = np.full(m_array.size, log_N + 1)
+    for _ in range(analytic_bisection_steps):
+        s = (lower + upper) / 2
+        t, one_minus_t = 1 / (1 + 10 ** -s), 1 / (1 + 10 ** s)
+        utility_A, utility_U = frontier_utilities(t, one_minus_t)
+        surplus_A = utility_A - failure_utility_A
+        surplus_U = utility_U - failure_utility_U
+        if is_nash:
+            # the nash product increases with t while this is positive
+            increase_t = np.where(surplus_A <= 0, True,
+                                  np.where(surplus_U <= 0, False,
+                                           surplus_U * one_minus_t - surplus_A * t > 0))
+        else:
+            # below the ks line (relative to the ideal point) while this is negative
+            increase_t = surplus_A * (best_utility_U - failure_utility_U) - \
+                (best_utility_A - failure_utility_A) * surplus_U < 0
+        lower = np.where(increase_t, s, lower)
+        upper = np.where(increase_t, upper, s)
+
+    s = (lower + upper) / 2
+    t, one_minus_t = 1 / (1 + 10 ** -s), 1 / (1 + 10 ** s)
+    utility_A, utility_U = frontier_utilities(t, one_minus_t)
+    solved = (m_array >= 0) & (m_array <= 1) & \
+        (utility_A > failure_utility_A) & (utility_U > failure_utility_U)
+    if not is_nash:
+        solved &= (best_utility_A > failure_utility_A) & (best_utility_U > failure_utility_U)
+    solutions[solved] = np.stack([t, t], axis = 1)[solved]
+    return solutions, solved
+##
+
+
+def _analytic_bargaining_solution(m, welfare_function,
+                                  bargaining_failure_utility_A,
+                                  bargaining_failure_utility_U):
+    """
+    scalar version of analytic_bargaining_solutions, in plain python as numpy
+    is slow on single numbers. returns the action profile or None.
+    """
+    if welfare_function in (nash_welfare_function, nash_welfare_function_array):
+        is_nash = True
+    elif welfare_function in (ks_welfare_function, ks_welfare_function_array):
+        is_nash = False
+    else:
+        return None
+    if not 0 <= m <= 1:
+        return None
+
+    failure_utility_A = float(bargaining_failure_utility_A)
+    failure_utility_U = float(bargaining_failure_utility_U)
+    frontier_log = lambda x: log10(N * x) if N * x >= 1 else 0.
+    if not is_nash:
+        best_utility_A, best_utility_U = ks_ideal_point(m)
+        if best_utility_A <= failure_utility_A or best_utility_U <= failure_utility_U:
+            return None
+
+    log_N = log10(N)
+    lower, upper = - log_N - 1, log_N + 1
+    for _ in range(analytic_bisection_steps):
+        s = (lower + upper) / 2
+        t, one_minus_t = 1 / (1 + 10 ** -s), 1 / (1 + 10 ** s)
+        surplus_A = frontier_log(t) - failure_utility_A
+        surplus_U = frontier_log(one_minus_t) - failure_utility_U
+        if is_nash:
+            if surplus_A <= 0 or surplus_U <= 0:
+                increase_t = surplus_A <= 0
+            else:
+                increase_t = surplus_U * one_minus_t - surplus_A * t > 0
+        else:
+            increase_t = surplus_A * (best_utility_U - failure_utility_U) - \
+                (best_utility_A - failure_utility_A) * surplus_U < 0
+        if increase_t:
+            lower = s
+        else:
+            upper = s
+
+    s = (lower + upper) / 2
+    t, one_minus_t = 1 / (1 + 10 ** -s), 1 / (1 + 10 ** s)
+    if frontier_log(t) <= failure_utility_A or frontier_log(one_minus_t) <= failure_utility_U:
+        return None
+    return np.array([t, t])
+##
+
+
+def _verify_analytic_solution(m, welfare_function,
+                              bargaining_failure_utility_A,
+                              bargaining_failure_utility_U,
+                              analytic_solution):
+    """ warns if the numeric solver finds utilities different to analytic_solution """
+    numeric_solution = find_bargaining_solution(m, welfare_function,
+                                                bargaining_failure_utility_A,
+                                                bargaining_failure_utility_U,
+                                                solver = 'numeric')
+    utilities = lambda solution: np.array([utility_A_from_actions(m, *solution),
+                                           utility_U_from_actions(m, *solution)])
+    difference = np.amax(np.abs(utilities(analytic_solution) - utilities(numeric_solution)))
+    if difference > analytic_verification_tolerance:
+        warnings.warn(f'analytic & numeric bargaining solutions differ by {difference} in utility '
+                      f'(m = {m}, welfare function = {welfare_function.__name__}, '
+                      f'failure utilities = ({bargaining_failure_utility_A}, {bargaining_failure_utility_U}), '
+                      f'analytic = {analytic_solution}, numeric = {numeric_solution})')
+##
+
+
+#### pareto frontier index ####
+
+"""
+the pareto frontier (see above) is the same curve for every m, so one index
+per N serves every m, welfare function & pair of failure utilities.
+it samples the frontier at frontier_samples points evenly spaced in
+s = log10(t/(1-t)), storing s, t & both teams' utilities as arrays.
+
+frontier_bargaining_solutions maximizes any welfare function along it:
+a coarse scan of the samples, then a binary zoom down to neighbouring samples
+(O(log frontier_samples) welfare evaluations per problem), then golden section
+search on the exact frontier between the neighbours of the best sample.
+this finds the bargaining solution of any welfare function that does not
+decrease when both teams' utilities rise (which puts its maximum on the frontier),
+like nash's. other welfare functions, e.g. the ks penalty, may peak off the
+frontier, so their frontier maxima are polished by the batched grid search
+in a small window around them.
+problems where no frontier sample leaves both teams better off than the
+disagreement outcome are not solved.
+"""
+
+frontier_samples = 2 ** 12 + 1
+frontier_coarse_points = 33 # samples scanned before zooming in
+frontier_refinement_steps = 48 # golden section steps between neighbouring samples
+frontier_polish_half_width = 2 ** -6 # half width of the grid search window around frontier maxima
+frontier_welfare_functions = (nash_welfare_function, nash_welfare_function_array) # maximized on the frontier, not polished
+
+@lru_cache(maxsize = None)
+def _pareto_frontier(N, samples):
+    log_N = np.log10(float(N))
+    s = np.linspace(- log_N - 1, log_N + 1, samples)
+    t, one_minus_t = 1 / (1 + 10 ** -s), 1 / (1 + 10 ** s)
+    frontier = {'s': s,
+                't': t,
+                'utility_A': specialLog_array(N * t),
+                'utility_U': specialLog_array(N * one_minus_t)}
+    for values in frontier.values():
+        values.setflags(write = False)
+    return frontier
+##
+
+def pareto_frontier() -> dict:
+    """
+    returns the frontier index for the current N, a dict of read only arrays
+    's', 't', 'utility_A' & 'utility_U', ordered by increasing t
+    """
+    return _pareto_frontier(N, frontier_samples)
+##
+
+def frontier_ideal_point() -> tuple:
+    """ the ks ideal point, read off the ends of the frontier """
+    frontier = pareto_frontier()
+    return frontier['utility_A'][-1], frontier['utility_U'][0]
+##
+
+def _broadcasting_welfare_function(welfare_function):
+    """ the array version of welfare_function, or a vectorized one for welfare functions without one """
+    array_welfare_function = array_welfare_functions.get(welfare_function, welfare_function)
+    if array_welfare_function not in array_welfare_functions.values():
+        return np.vectorize(welfare_function, otypes = [float])
+    return array_welfare_function
+##
+
+def _frontier_welfare(welfare_function, m, s, failure_utility_A, failure_utility_U):
+    """ welfare at the frontier points with log odds s, broadcasting its arguments """
+    t = 1 / (1 + 10 ** -s)
+    array_welfare_function = _broadcasting_welfare_function(welfare_function)
+    return array_welfare_function(m = m, action_A = t, action_U = t,
+                                  bargaining_failure_utility_A = failure_utility_A,
+                                  bargaining_failure_utility_U = failure_utility_U)
+##
+
+def frontier_bargaining_solutions(m_array: np.ndarray,
+                                  welfare_function: Callable,
+                                  bargaining_failure_utility_A_array: np.ndarray,
+                                  bargaining_failure_utility_U_array: np.ndarray) -> tuple:
+    """
+    returns (solutions, solved) like analytic_bargaining_solutions, for any
+    welfare function (scalar or array version), by searching the frontier index.
+    problems are not solved (& their rows are nan) if m is outside [0, 1],
+    if no frontier sample leaves both teams better off than the disagreement
+    outcome, or if polishing a maximum off the frontier doesn't converge.
+    """
+    m_array, failure_utility_A, failure_utility_U = \
+        np.broadcast_arrays(np.atleast_1d(np.asarray(m_array, dtype = float)),
+                            np.asarray(bargaining_failure_utility_A_array, dtype = float),
+                            np.asarray(bargaining_failure_utility_U_array, dtype = float))
+    s = pareto_frontier()['s']
+    welfare_along = lambda s_values: _frontier_welfare(welfare_function, m_array[:, None], s_values,
+                                                       failure_utility_A[:, None], failure_utility_U[:, None])
+    rows = np.arange(m_array.size)
+
+    # coarse scan, then halve the spacing around the best sample until it is 1
+    stride = max((s.size - 1) // (frontier_coarse_points - 1), 1)
+    coarse_indices = np.arange(0, s.size, stride)
+    coarse_welfare = welfare_along(np.broadcast_to(s[coarse_indices], (m_array.size, coarse_indices.size)))
+    best = coarse_indices[np.argmax(coarse_welfare, axis = 1)]
+    while stride > 1:
+        stride //= 2
+        candidates = np.clip(best[:, None] + stride * np.array([-1, 0, 1]), 0, s.size - 1)
+        best = candidates[rows, np.argmax(welfare_along(s[candidates]), axis = 1)]
+
+    # golden section search on the exact frontier between the best sample's neighbours
+    lower = s[np.maximum(best - 1, 0)][:, None]
+    upper = s[np.minimum(best + 1, s.size - 1)][:, None]
+    golden_ratio = (np.sqrt(5) - 1) / 2
+    for _ in range(frontier_refinement_steps):
+        inner_lower = upper - golden_ratio * (upper - lower)
+        inner_upper = lower + golden_ratio * (upper - lower)
+        move_up = welfare_along(inner_upper) > welfare_along(inner_lower)
+        lower = np.where(move_up, inner_lower, lower)
+        upper = np.where(move_up, upper, inner_upper)
+    refined_s = ((lower + upper) / 2)[:, 0]
+    # the golden section search assumes one peak between the neighbours, keep the sample if it was better
+    sample_is_better = welfare_along(s[best][:, None])[:, 0] > welfare_along(refined_s[:, None])[:, 0]
+    refined_s = np.where(sample_is_better, s[best], refined_s)
+
+    # utility_A rises & utility_U falls along the frontier, so both teams gain
+    # somewhere iff the first sample where A gains comes before the last where U gains
+    frontier = pareto_frontier()
+    first_gain_A = np.searchsorted(frontier['utility_A'], failure_utility_A, side = 'right')
+    gains_U = s.size - np.searchsorted(frontier['utility_U'][::-1], failure_utility_U, side = 'right')
+    solved = (m_array >= 0) & (m_array <= 1) & (first_gain_A < gains_U)
+
+    t = 1 / (1 + 10 ** -refined_s)
+    solutions = np.full((m_array.size, 2), np.nan)
+    solutions[solved] = np.stack([t, t], axis = 1)[solved]
+
+    problems = np.flatnonzero(solved)
+    if welfare_function not in frontier_welfare_functions and problems.size > 0:
+        polished_solutions, converged = _grid_search_bargaining_solutions(
+            m_array[problems], _broadcasting_welfare_function(welfare_function),
+            failure_utility_A[problems], failure_utility_U[problems],
+            centres = solutions[problems],
+            half_widths = np.full(problems.size, frontier_polish_half_width))
+        solutions[problems] = np.where(converged[:, None], polished_solutions, np.nan)
+        solved[problems] = converged
+    return solutions, solved
+##
+
+
+#### instrumentation ####
+
+"""
+opt-in counters & timers for the solvers. while an instrumentation() context
+is active, the solvers record what they do into its stats dict, otherwise
+_instrumentation is None & checking that is all they pay for.
+"""
+
+_instrumentation = None
+
+def _new_instrumentation_stats():
+    return {'solves': {'numeric': 0, # solved by scipy.optimize
+                       'analytic': 0, # solved in closed form / by bisection
+                       'batched': 0, # solved by the batched grid search
+                       'frontier': 0, # solved by searching the pareto frontier index
+                       'cached': 0, # served from the solution cache
+                       'unconverged': 0, # returned without converging, including from the cache
+                       'finite_difference_retries': 0,
+                       'restarts': 0, # optimizer runs of multi-start solves
+                       'iterations': 0, # scipy.optimize iterations
+                       'batch_rounds': 0, # batched grid search rounds
+                       'objective_evaluations': 0, # scipy.optimize nfev
+                       'gradient_evaluations': 0, # scipy.optimize njev
+                       'seconds': 0.},
+            # welfare function name -> calls, points evaluated & seconds spent in it
+            'welfare_functions': {},
+            # (m, welfare function name, failure utility A, failure utility U) of unconverged solves
+            'unconverged_problems': [],
+            # per cell stats of the heatmaps filled, see heatmaps.compute_heatmap_values
+            'heatmaps': []}
+##
+
+@contextmanager
+def instrumentation():
+    """
+    collects solver stats while active, yields the stats dict they are
+    recorded in (see _new_instrumentation_stats & instrumentation_report).
+    contexts can be nested, inner stats are added to the outer ones on exit.
+    """
+    global _instrumentation
+    outer_stats = _instrumentation
+    stats = _new_instrumentation_stats()
+    _instrumentation = stats
+    try:
+        yield stats
+    finally:
+        _instrumentation = outer_stats
+        if outer_stats is not None:
+            merge_instrumentation_stats(outer_stats, stats)
+##
+
+def instrumentation_stats() -> dict:
+    """ returns the stats dict of the innermost active instrumentation context, or None """
+    return _instrumentation
+##
+
+def merge_instrumentation_stats(stats: dict, other_stats: dict) -> None:
+    """ adds other_stats (e.g. collected in another process) into stats """
+    for key, value in other_stats.items():
+        if isinstance(value, dict):
+            merge_instrumentation_stats(stats.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            stats.setdefault(key, []).extend(value)
+        else:
+            stats[key] = stats.get(key, 0) + value
+##
+
+def fresh_solves(stats: dict) -> int:
+    """ number of bargaining problems actually solved (not served from the cache) in stats """
+    return sum(stats['solves'][kind] for kind in ('numeric', 'analytic', 'batched', 'frontier'))
+##
+
+def _function_name(function):
+    return getattr(function, '__name__', repr(function))
+##
+
+def _instrumented_welfare_function(welfare_function):
+    """ wraps welfare_function to record its calls, points evaluated & time taken """
+    record = _instrumentation['welfare_functions'].setdefault(
+        _function_name(welfare_function), {'calls': 0, 'points': 0, 'seconds': 0.})
+    def instrumented_welfare_function(**kwargs):
+        start = time.perf_counter()
+        welfare = welfare_function(**kwargs)
+        record['seconds'] += time.perf_counter() - start
+        record['calls'] += 1
+        record['points'] += np.size(welfare)
+        return welfare
+    return instrumented_welfare_function
+##
+
+def _record_optimizer_result(result):
+    _instrumentation['solves']['iterations'] += result.get('nit', 0)
+    _instrumentation['solves']['objective_evaluations'] += result.get('nfev', 0)
+    _instrumentation['solves']['gradient_evaluations'] += result.get('njev', 0)
+    _instrumentation['solves']['finite_difference_retries'] += result.get('finite_difference_retries', 0)
+##
+
+def _record_unconverged(m, welfare_function, bargaining_failure_utility_A, bargaining_failure_utility_U):
+    _instrumentation['solves']['unconverged'] += 1
+    _instrumentation['unconverged_problems'].append((float(m), _function_name(welfare_function),
+                                                     float(bargaining_failure_utility_A),
+                                                     float(bargaining_failure_utility_U)))
+##
+
+def instrumentation_report(stats: dict) -> str:
+    """ returns a human readable summary of stats """
+    solves = stats['solves']
+    lines = ['solves:']
+    lines += [f'  {kind}: {count:.4g}' for kind, count in solves.items()]
+    lines.append('welfare functions:')
+    for name, record in stats['welfare_functions'].items():
+        lines.append(f'  {name}: {record["calls"]} calls, {record["points"]} points, '
+                     f'{record["seconds"]:.4g}s')
+    # the ks ideal point is closed form, so ks_welfare_function triggers no nested solves
+    lines.append(f'ks ideal point: {_ks_ideal_point.cache_info()}')
+    for heatmap in stats['heatmaps']:
+        lines.append(f'heatmap {heatmap["seconds"].shape[0]}x{heatmap["seconds"].shape[1]}: '
+                     f'{heatmap["seconds"].sum():.4g}s, {int(heatmap["solves"].sum())} solves, '
+                     f'{np.count_nonzero(heatmap["unconverged"])} cells with unconverged solves, '
+                     f'slowest cell {heatmap["seconds"].max():.4g}s')
+    if stats['unconverged_problems']:
+        lines.append('unconverged problems (m, welfare function, failure utility A, failure utility U):')
+        lines += [f'  {problem}' for problem in stats['unconverged_problems']]
+    return '\n'.join(lines)
+##
+
+
 #### computing bargaining solutions & associated funcs ####
 
+"""
+bargaining solutions are memoized in a least recently used cache, keyed on
+m, the welfare function, the failure utilities & the solver settings.
+floats in the key are rounded to solution_cache_tolerance so that nearly
+identical problems (e.g. m values that went through ratio_shifted) share
+an entry.
+"""
+
+_solution_cache = OrderedDict()
+_solution_cache_stats = {'hits': 0, 'misses': 0}
+
+def _solution_cache_key(m, welfare_function,
+                        bargaining_failure_utility_A,
+                        bargaining_failure_utility_U,
+                        solver):
+    quantize = lambda x: round(float(x) / solution_cache_tolerance)
+    return (quantize(m), welfare_function,
+            quantize(bargaining_failure_utility_A),
+            quantize(bargaining_failure_utility_U),
+            solver, N)
+##
+
+def _cached_solution(key):
+    """ returns a copy of the cached solution for key, or None on a miss """
+    if key in _solution_cache:
+        _solution_cache.move_to_end(key)
+        _solution_cache_stats['hits'] += 1
+        solution, converged = _solution_cache[key]
+        if _instrumentation is not None:
+            _instrumentation['solves']['cached'] += 1
+            _instrumentation['solves']['unconverged'] += not converged
+        return solution.copy()
+    _solution_cache_stats['misses'] += 1
+    return None
+##
+
+def _cache_solution(key, solution, converged = True):
+    if solution_cache_size <= 0:
+        return
+    _solution_cache[key] = (np.array(solution, dtype = float), converged)
+    _solution_cache.move_to_end(key)
+    while len(_solution_cache) > solution_cache_size:
+        _solution_cache.popitem(last = False)
+##
+
+def solution_cache_info() -> dict:
+    """ returns the hit & miss counts, current size and size bound of the solution cache """
+    return {'hits': _solution_cache_stats['hits'],
+            'misses': _solution_cache_stats['misses'],
+            'size': len(_solution_cache),
+            'max_size': solution_cache_size}
+##
+
+def clear_solution_cache() -> None:
+    """ empties the solution cache & resets its counters """
+    _solution_cache.clear()
+    _solution_cache_stats['hits'] = 0
+    _solution_cache_stats['misses'] = 0
+##
+
+
+# module level settings that change the bargaining solutions found, see solver_settings
+solver_setting_names = ('optimization_algo', 'bargaining_solver', 'initial_action_profile_guess',
+                        'use_analytic_gradients', 'batch_method', 'batch_grid_points', 'batch_tolerance',
+                        'batch_max_rounds', 'analytic_bisection_steps', 'multistart_restarts', 'multistart_seeds',
+                        'multistart_prescan_points', 'multistart_seed_separation', 'frontier_samples',
+                        'frontier_coarse_points', 'frontier_refinement_steps', 'frontier_polish_half_width')
+
+def solver_settings() -> dict:
+    """
+    returns the current values of the settings in solver_setting_names, e.g. to
+    include in the configuration stored results are keyed on (see store.py)
+    """
+    return {name: list(value) if isinstance(value, (list, tuple)) else value
+            for name, value in ((name, globals()[name]) for name in solver_setting_names)}
+##
+
+
+def _minimize(**kwargs):
+    """ scipy.optimize.minimize, importing scipy.optimize the first time it is needed """
+    global optimizer
+    if optimizer is None:
+        import scipy.optimize as optimizer
+    return optimizer.minimize(**kwargs)
+##
+
 
 def find_bargaining_solution(m: float,
                              welfare_function: Callable,
                              bargaining_failure_utility_A: float,
-                             bargaining_failure_utility_U: float) -> tuple:
+                             bargaining_failure_utility_U: float,
+                             initial_guess: tuple = None,
+                             full_output: bool = False,
+                             solver: str = None) -> tuple:
     """
     returns the action profile (as a tuple of 2 floats - (action_A, action_U))
     for a bargaining solution according to welfare_function
 
     bargaining_failure_utilities is a tuple of 2 floats representing 
     the utilities when bargaining fails
+
+    initial_guess is the action profile the optimizer starts from,
+    initial_action_profile_guess if None (e.g. a nearby problem's solution).
+    if full_output, returns (action profile, number of optimizer iterations),
+    with 0 iterations for solutions found in the cache.
+
+    solver is 'numeric' (scipy.optimize), 'multistart' (scipy.optimize from many
+    starting points, see multistart_initial_guesses, ignoring initial_guess),
+    'frontier' (see frontier_bargaining_solutions, falling back to 'numeric'
+    for m outside [0, 1]) or 'analytic', which is used for the built in welfare
+    functions when the solution is on the pareto frontier
+    (see analytic_bargaining_solutions) & falls back to 'numeric' otherwise.
+    if verify_analytic_solutions, analytic solutions are cross-checked against
+    the numeric solver. defaults to bargaining_solver.
+    """
+    if solver is None:
+        solver = bargaining_solver
+    if solver == 'analytic':
+        analytic_solution = _analytic_bargaining_solution(m, welfare_function,
+                                                          bargaining_failure_utility_A,
+                                                          bargaining_failure_utility_U)
+        if analytic_solution is not None:
+            if _instrumentation is not None:
+                _instrumentation['solves']['analytic'] += 1
+            if verify_analytic_solutions:
+                _verify_analytic_solution(m, welfare_function,
+                                          bargaining_failure_utility_A,
+                                          bargaining_failure_utility_U,
+                                          analytic_solution)
+            return (analytic_solution, 0) if full_output else analytic_solution
+
+    if solver == 'frontier':
+        frontier_solutions, solved = frontier_bargaining_solutions(m, welfare_function,
+                                                                   bargaining_failure_utility_A,
+                                                                   bargaining_failure_utility_U)
+        if solved[0]:
+            if _instrumentation is not None:
+                _instrumentation['solves']['frontier'] += 1
+            return (frontier_solutions[0], 0) if full_output else frontier_solutions[0]
+
+    if solver == 'multistart':
+        solver_key = ('multistart', optimization_algo, multistart_restarts, multistart_seeds,
+                      multistart_prescan_points, multistart_seed_separation, use_analytic_gradients)
+    else:
+        # solutions depend on where the optimizer starts, so warm started solves are kept apart
+        start = initial_action_profile_guess if initial_guess is None else initial_guess
+        solver_key = (optimization_algo, tuple(float(x) for x in start), use_analytic_gradients)
+    cache_key = _solution_cache_key(m, welfare_function,
+                                    bargaining_failure_utility_A,
+                                    bargaining_failure_utility_U,
+                                    solver = solver_key)
+    cached_solution = _cached_solution(cache_key)
+    if cached_solution is not None:
+        return (cached_solution, 0) if full_output else cached_solution
+
+    stats = _instrumentation
+    if stats is not None:
+        start = time.perf_counter()
+    if solver == 'multistart':
+        solution = _multistart_bargaining_solution(m, welfare_function,
+                                                   bargaining_failure_utility_A,
+                                                   bargaining_failure_utility_U)
+    else:
+        if initial_guess is None:
+            initial_guess = initial_action_profile_guess
+        solution = _numeric_bargaining_solution(m, welfare_function,
+                                                bargaining_failure_utility_A,
+                                                bargaining_failure_utility_U,
+                                                initial_guess)
+
+    if stats is not None:
+        stats['solves']['numeric'] += 1
+        stats['solves']['seconds'] += time.perf_counter() - start
+        if not solution.success:
+            _record_unconverged(m, welfare_function,
+                                bargaining_failure_utility_A,
+                                bargaining_failure_utility_U)
+    _cache_solution(cache_key, solution.x, converged = bool(solution.success))
+    return (solution.x, solution.nit) if full_output else solution.x
+##
+
+
+def _numeric_bargaining_solution(m, welfare_function,
+                                 bargaining_failure_utility_A,
+                                 bargaining_failure_utility_U,
+                                 initial_guess):
+    """
+    runs the optimizer from initial_guess, returns its scipy.optimize.OptimizeResult
+    (with the iterations & evaluations of any finite difference retry added in)
     """
+    stats = _instrumentation
+    evaluate_welfare = welfare_function if stats is None else _instrumented_welfare_function(welfare_function)
+
     def negative_welfare(action_profile):
         action_A = action_profile[0]
         action_U = action_profile[1]
-        welfare = welfare_function(m = m,
+        welfare = evaluate_welfare(m = m,
                                    action_A = action_A,
                                    action_U = action_U,
                                    bargaining_failure_utility_A = bargaining_failure_utility_A,
                                    bargaining_failure_utility_U = bargaining_failure_utility_U)
         return - welfare
 
-    initial_guess = np.array(initial_action_profile_guess)
+    # use exact derivatives where we have them, otherwise scipy uses finite differences
+    negative_welfare_gradient = None
+    negative_welfare_hessian = None
+    if use_analytic_gradients and welfare_function in welfare_function_gradients:
+        welfare_gradient = _scalar_welfare_function_gradients.get(welfare_function,
+                                                                  welfare_function_gradients[welfare_function])
+        def negative_welfare_gradient(action_profile):
+            return - welfare_gradient(m, action_profile[0], action_profile[1],
+                                      bargaining_failure_utility_A,
+                                      bargaining_failure_utility_U)
+    if use_analytic_gradients and welfare_function in welfare_function_hessians and \
+       optimization_algo in hessian_methods:
+        welfare_hessian = welfare_function_hessians[welfare_function]
+        def negative_welfare_hessian(action_profile):
+            return - welfare_hessian(m, action_profile[0], action_profile[1],
+                                     bargaining_failure_utility_A,
+                                     bargaining_failure_utility_U)
+
+    initial_guess = np.clip(np.array(initial_guess, dtype = float), 0., 1.)
     search_bounds = np.array([(0., 1.), (0., 1.)])
-    solution = optimizer.minimize(fun = negative_welfare,
-                                  x0 = initial_guess,
-                                  bounds = search_bounds,
-                                  method = optimization_algo)
-    return solution.x
+    solution = _minimize(fun = negative_welfare,
+                         x0 = initial_guess,
+                         jac = negative_welfare_gradient,
+                         hess = negative_welfare_hessian,
+                         bounds = search_bounds,
+                         method = optimization_algo)
+    # specialLog is flat below 1, so exact gradients are 0 for actions of 0 or 1
+    # and the optimizer can get stuck on those bounds, where finite differences
+    # still see the jump. if that happens, retry with finite differences.
+    finite_difference_retries = 0
+    if negative_welfare_gradient is not None and \
+       np.any((N * solution.x < 1) | (N * (1 - solution.x) < 1)):
+        finite_difference_solution = _minimize(fun = negative_welfare,
+                                               x0 = initial_guess,
+                                               bounds = search_bounds,
+                                               method = optimization_algo)
+        finite_difference_retries = 1
+        totals = {key: solution.get(key, 0) + finite_difference_solution.get(key, 0)
+                  for key in ('nit', 'nfev', 'njev')}
+        if finite_difference_solution.fun <= solution.fun:
+            solution = finite_difference_solution
+        solution.update(totals)
+    solution['finite_difference_retries'] = finite_difference_retries
+
+    if stats is not None:
+        _record_optimizer_result(solution)
+    return solution
+##
+
+
+#### multi-start solves ####
+
+"""
+with solver = 'multistart', find_bargaining_solution runs the optimizer from
+multistart_restarts starting points & keeps the best solution, guarding against
+local optima (e.g. of ks_welfare_function's penalty, or where specialLog is flat).
+
+multistart_seeds chooses the starting points:
+'grid'   = the best points of a multistart_prescan_points ** 2 grid over [0, 1]^2,
+           evaluated in one vectorized call for the built in welfare functions,
+           each at least multistart_seed_separation grid steps from the better
+           ones taken (fewer steps if there aren't enough such points), so the
+           seeds sit on distinct peaks rather than around the best one
+'sobol'  = a scrambled sobol sequence
+'lhs'    = a latin hypercube sample
+with multistart_workers > 1, the restarts run in that many processes, which are
+kept for later solves (welfare functions must then be picklable). each restart
+is sent N & the solver settings, so the workers solve under the current ones.
+"""
+
+multistart_restarts = 8
+multistart_seeds = 'grid'
+multistart_prescan_points = 17
+multistart_seed_separation = 4
+multistart_workers = 1
+
+_multistart_executor = None
+_multistart_executor_workers = 0
+
+def multistart_initial_guesses(m: float,
+                               welfare_function: Callable,
+                               bargaining_failure_utility_A: float,
+                               bargaining_failure_utility_U: float,
+                               restarts: int = None,
+                               seeds: str = None) -> np.ndarray:
+    """ returns the (restarts, 2) array of action profiles multi-start solves start from """
+    if restarts is None:
+        restarts = multistart_restarts
+    if seeds is None:
+        seeds = multistart_seeds
+
+    if seeds == 'sobol' or seeds == 'lhs':
+        from scipy.stats import qmc
+        if seeds == 'lhs':
+            return qmc.LatinHypercube(d = 2, seed = 0).random(restarts)
+        # sobol sequences are balanced in blocks of powers of 2
+        return qmc.Sobol(d = 2, seed = 0).random_base2(int(np.ceil(np.log2(restarts))))[:restarts]
+
+    axis = np.linspace(0., 1., multistart_prescan_points)
+    actions_A, actions_U = np.meshgrid(axis, axis, indexing = 'ij')
+    if welfare_function in array_welfare_functions:
+        welfare = array_welfare_functions[welfare_function](
+            m = m, action_A = actions_A, action_U = actions_U,
+            bargaining_failure_utility_A = bargaining_failure_utility_A,
+            bargaining_failure_utility_U = bargaining_failure_utility_U)
+    else:
+        welfare = np.array([welfare_function(m, action_A, action_U,
+                                             bargaining_failure_utility_A,
+                                             bargaining_failure_utility_U)
+                            for action_A, action_U in zip(actions_A.ravel(), actions_U.ravel())])
+    # greedy non-maximum suppression on the grid
+    ranked = np.argsort(- np.ravel(welfare), kind = 'stable')
+    ranked_indices = np.stack(np.unravel_index(ranked, welfare.shape), axis = 1)
+    seeds = []
+    taken = np.empty((0, 2), dtype = int) # grid indices of seeds
+    for separation in range(max(multistart_seed_separation, 1), 0, -1):
+        for cell, index in zip(ranked, ranked_indices):
+            if len(seeds) == restarts:
+                break
+            if np.all(np.max(np.abs(taken - index), axis = 1, initial = 0) >= separation):
+                seeds.append(cell)
+                taken = np.vstack([taken, index])
+    return np.stack([actions_A.ravel()[seeds], actions_U.ravel()[seeds]], axis = 1)
+##
+
+
+def _multistart_bargaining_solution(m, welfare_function,
+                                    bargaining_failure_utility_A,
+                                    bargaining_failure_utility_U):
+    """ the best of the optimizer's solutions from each of multistart_initial_guesses """
+    global _multistart_executor, _multistart_executor_workers
+    initial_guesses = multistart_initial_guesses(m, welfare_function,
+                                                 bargaining_failure_utility_A,
+                                                 bargaining_failure_utility_U)
+    problem = [m, welfare_function, bargaining_failure_utility_A, bargaining_failure_utility_U]
+    if multistart_workers > 1:
+        if _multistart_executor_workers != multistart_workers:
+            from concurrent.futures import ProcessPoolExecutor
+            if _multistart_executor is not None:
+                _multistart_executor.shutdown()
+            _multistart_executor = ProcessPoolExecutor(max_workers = multistart_workers)
+            _multistart_executor_workers = multistart_workers
+        # the workers keep the settings they were started with, so send the current ones
+        settings = dict(solver_settings(), N = N)
+        solutions = list(_multistart_executor.map(_numeric_bargaining_solution_with_settings,
+                                                  *zip(*[[settings] + problem + [guess]
+                                                         for guess in initial_guesses])))
+        # the workers can't record into this process' instrumentation
+        if _instrumentation is not None:
+            for solution in solutions:
+                _record_optimizer_result(solution)
+    else:
+        solutions = [_numeric_bargaining_solution(*problem, guess) for guess in initial_guesses]
+
+    if _instrumentation is not None:
+        _instrumentation['solves']['restarts'] += len(solutions)
+    best_solution = min(solutions, key = lambda solution: solution.fun)
+    best_solution.nit = sum(solution.nit for solution in solutions)
+    return best_solution
+##
+
+
+def _numeric_bargaining_solution_with_settings(settings, *problem):
+    """ _numeric_bargaining_solution after applying settings (N & solver settings), run in the worker processes """
+    globals().update(settings)
+    return _numeric_bargaining_solution(*problem)
+##
+
+
+def find_bargaining_solutions_continuation(m_array: np.ndarray,
+                                           welfare_function: Callable,
+                                           bargaining_failure_utility_A_array: np.ndarray,
+                                           bargaining_failure_utility_U_array: np.ndarray,
+                                           predictor: bool = False) -> tuple:
+    """
+    solves a sweep of bargaining problems with find_bargaining_solution,
+    in order of increasing m, starting each solve from the solution at
+    the previous m. if predictor, starts from a linear extrapolation
+    (in log(m/(1-m))) of the previous two solutions instead.
+
+    returns (solutions, iterations): an (n, 2) array of action profiles
+    in the order of m_array & the number of optimizer iterations for each.
+    """
+    m_array, failure_utility_A, failure_utility_U = \
+        np.broadcast_arrays(np.atleast_1d(np.asarray(m_array, dtype = float)),
+                            np.asarray(bargaining_failure_utility_A_array, dtype = float),
+                            np.asarray(bargaining_failure_utility_U_array, dtype = float))
+    solutions = np.empty((m_array.size, 2))
+    iterations = np.zeros(m_array.size, dtype = int)
+
+    log_m_ratios = np.log(m_array / (1 - m_array))
+    previous = [] # indices of the last two problems solved
+    for i in np.argsort(m_array, kind = 'stable'):
+        initial_guess = None
+        if previous:
+            initial_guess = solutions[previous[-1]]
+        if predictor and len(previous) == 2:
+            j, k = previous
+            step = log_m_ratios[k] - log_m_ratios[j]
+            if step > 0:
+                slope = (solutions[k] - solutions[j]) / step
+                initial_guess = solutions[k] + slope * (log_m_ratios[i] - log_m_ratios[k])
+
+        solutions[i], iterations[i] = \
+            find_bargaining_solution(m = m_array[i],
+                                     welfare_function = welfare_function,
+                                     bargaining_failure_utility_A = failure_utility_A[i],
+                                     bargaining_failure_utility_U = failure_utility_U[i],
+                                     initial_guess = initial_guess,
+                                     full_output = True)
+        previous = (previous + [i])[-2:]
+    return solutions, iterations
+##
+
+
+#### batched bargaining solutions ####
+
+# array versions of the built in welfare functions, used by the batched solver
+array_welfare_functions = {nash_welfare_function: nash_welfare_function_array,
+                           ks_welfare_function: ks_welfare_function_array}
+
+def find_bargaining_solutions(m_array: np.ndarray,
+                              welfare_function: Callable,
+                              bargaining_failure_utility_A_array: np.ndarray,
+                              bargaining_failure_utility_U_array: np.ndarray) -> np.ndarray:
+    """
+    solves many bargaining problems in one call, returns an (n, 2) array
+    whose rows are the action profiles (action_A, action_U) of the
+    bargaining solutions for each m & pair of bargaining failure utilities.
+
+    welfare_function can be a built in welfare function or its array version.
+    with batch_method = 'grid_search', all problems are solved together by
+    a grid search over [0, 1]^2 that zooms in on the best grid point of
+    each problem every round.
+    with batch_method = 'continuation', or for welfare functions with no
+    array version, problems are solved one by one with
+    find_bargaining_solutions_continuation.
+    with batch_method = 'analytic' or 'frontier', problems are solved with
+    analytic_bargaining_solutions or frontier_bargaining_solutions where
+    possible & by grid search otherwise.
+    """
+    m_array, failure_utility_A, failure_utility_U = \
+        np.broadcast_arrays(np.atleast_1d(np.asarray(m_array, dtype = float)),
+                            np.asarray(bargaining_failure_utility_A_array, dtype = float),
+                            np.asarray(bargaining_failure_utility_U_array, dtype = float))
+
+    scalar_welfare_functions = {array_version: scalar_version for scalar_version, array_version
+                                in array_welfare_functions.items()}
+    if batch_method == 'continuation' or \
+       (welfare_function not in array_welfare_functions and
+        welfare_function not in scalar_welfare_functions):
+        solutions, _ = find_bargaining_solutions_continuation(
+            m_array = m_array,
+            welfare_function = scalar_welfare_functions.get(welfare_function, welfare_function),
+            bargaining_failure_utility_A_array = failure_utility_A,
+            bargaining_failure_utility_U_array = failure_utility_U)
+        return solutions
+    array_welfare_function = array_welfare_functions.get(welfare_function, welfare_function)
+
+    if batch_method == 'analytic' or batch_method == 'frontier':
+        batch_solver = analytic_bargaining_solutions if batch_method == 'analytic' else \
+            frontier_bargaining_solutions
+        solutions, solved = batch_solver(m_array, welfare_function,
+                                         failure_utility_A, failure_utility_U)
+        if _instrumentation is not None:
+            _instrumentation['solves'][batch_method] += int(np.count_nonzero(solved))
+        if not np.all(solved):
+            unsolved = ~solved
+            solutions[unsolved] = _cached_grid_search(m_array[unsolved], array_welfare_function,
+                                                      failure_utility_A[unsolved],
+                                                      failure_utility_U[unsolved])
+        return solutions
+    return _cached_grid_search(m_array, array_welfare_function, failure_utility_A, failure_utility_U)
+##
+
+
+def _cached_grid_search(m_array, array_welfare_function, failure_utility_A, failure_utility_U):
+    """ _grid_search_bargaining_solutions, for the problems that are not in the solution cache """
+    solver = ('batch', batch_grid_points, batch_tolerance, batch_max_rounds)
+    cache_keys = [_solution_cache_key(m, array_welfare_function, d_A, d_U, solver)
+                  for m, d_A, d_U in zip(m_array, failure_utility_A, failure_utility_U)]
+    solutions = np.empty((m_array.size, 2))
+    unsolved = []
+    for i, cache_key in enumerate(cache_keys):
+        cached_solution = _cached_solution(cache_key)
+        if cached_solution is None:
+            unsolved.append(i)
+        else:
+            solutions[i] = cached_solution
+    if unsolved:
+        stats = _instrumentation
+        evaluate_welfare = array_welfare_function
+        if stats is not None:
+            start = time.perf_counter()
+            evaluate_welfare = _instrumented_welfare_function(array_welfare_function)
+        solutions[unsolved], converged = _grid_search_bargaining_solutions(m_array[unsolved],
+                                                                           evaluate_welfare,
+                                                                           failure_utility_A[unsolved],
+                                                                           failure_utility_U[unsolved])
+        if stats is not None:
+            stats['solves']['batched'] += len(unsolved)
+            stats['solves']['seconds'] += time.perf_counter() - start
+            for i in np.array(unsolved)[~converged]:
+                _record_unconverged(m_array[i], array_welfare_function,
+                                    failure_utility_A[i], failure_utility_U[i])
+        for i, solution_converged in zip(unsolved, converged):
+            _cache_solution(cache_keys[i], solutions[i], converged = bool(solution_converged))
+    return solutions
+##
+
+
+def _grid_search_bargaining_solutions(m_array, welfare_function,
+                                      failure_utility_A, failure_utility_U,
+                                      centres = None, half_widths = None):
+    """
+    the batched solver behind find_bargaining_solutions, takes 1d arrays & an array welfare function.
+    searches from the windows centres +- half_widths, [0, 1] x [0, 1] by default.
+    returns the (n, 2) array of solutions & whether each one converged within batch_max_rounds.
+    """
+    # broadcast problems along axis 0, grid points along axes 1 (action_A) & 2 (action_U)
+    m_grid = m_array[:, None, None]
+    failure_utility_A = failure_utility_A[:, None, None]
+    failure_utility_U = failure_utility_U[:, None, None]
+    grid_offsets = np.linspace(-1., 1., batch_grid_points)
+
+    centres = np.full((m_array.size, 2), 0.5) if centres is None else np.array(centres, dtype = float)
+    half_widths = np.full(m_array.size, 0.5) if half_widths is None else np.array(half_widths, dtype = float)
+    edges = (0, batch_grid_points - 1)
+    active = half_widths >= batch_tolerance
+    for _ in range(batch_max_rounds):
+        if not np.any(active):
+            break
+        if _instrumentation is not None:
+            _instrumentation['solves']['batch_rounds'] += 1
+        problems = np.flatnonzero(active)
+        actions_A = np.clip(centres[problems, 0, None] +
+                            half_widths[problems, None] * grid_offsets, 0., 1.)
+        actions_U = np.clip(centres[problems, 1, None] +
+                            half_widths[problems, None] * grid_offsets, 0., 1.)
+        welfare = welfare_function(m = m_grid[problems],
+                                   action_A = actions_A[:, :, None],
+                                   action_U = actions_U[:, None, :],
+                                   bargaining_failure_utility_A = failure_utility_A[problems],
+                                   bargaining_failure_utility_U = failure_utility_U[problems])
+        best = np.argmax(welfare.reshape(problems.size, -1), axis = 1)
+        best_A, best_U = np.unravel_index(best, (batch_grid_points, batch_grid_points))
+        rows = np.arange(problems.size)
+        centres[problems, 0] = actions_A[rows, best_A]
+        centres[problems, 1] = actions_U[rows, best_U]
+
+        # zoom in on the best point, unless it is on the edge of the window
+        # (but not of [0, 1]), in which case move & widen the window instead
+        on_edge_A = np.isin(best_A, edges) & (centres[problems, 0] > 0.) & (centres[problems, 0] < 1.)
+        on_edge_U = np.isin(best_U, edges) & (centres[problems, 1] > 0.) & (centres[problems, 1] < 1.)
+        on_edge = on_edge_A | on_edge_U
+        half_widths[problems[~on_edge]] *= 4. / (batch_grid_points - 1)
+        half_widths[problems[on_edge]] = np.minimum(2. * half_widths[problems[on_edge]], 0.5)
+        active = half_widths >= batch_tolerance
+    return centres, ~active
+##
+
+
+#### expected utilities ####
+
+def ratio_shifted(x):
+    """
+    returns x' such that x'/(1-x') = (1 + delta) * x/(1-x).
+    works on floats & arrays.
+    """
+    return ratio_scaled(x, 1 + delta)
 ##
 
+def ratio_scaled(x, factor):
+    """ returns x' such that x'/(1-x') = factor * x/(1-x), works on floats & arrays """
+    scaled_ratio = x/(1 - x) * factor
+    return scaled_ratio / (1 + scaled_ratio)
+##
 
 def expected_utility_A(m: float,
                        p: float,
                        welfare_function: Callable,
                        bargaining_failure_utility_A: Callable,
-                       bargaining_failure_utility_U: Callable) -> float:
+                       bargaining_failure_utility_U: Callable,
+                       initial_guess: tuple = None) -> float:
     """ 
     given a point on (m, p), and a welfare function,
     compute and return the expected utility for team aligned.
 
     bargaining_failure_utility_A/U are functions of m.
+    initial_guess is passed on to find_bargaining_solution.
     """
     bargaining_solution = \
         find_bargaining_solution(m = m,
-                                 welfare_function = nash_welfare_function,
+                                 welfare_function = welfare_function,
                                  bargaining_failure_utility_A = bargaining_failure_utility_A(m),
-                                 bargaining_failure_utility_U = bargaining_failure_utility_U(m))
+                                 bargaining_failure_utility_U = bargaining_failure_utility_U(m),
+                                 initial_guess = initial_guess)
     action_profile = bargaining_solution
     action_A = action_profile[0]
     action_U = action_profile[1]
@@ -193,16 +1473,20 @@ def expected_utility_A_delta_m(m: float,
     returns expected_utility_A((1 + delta)m, p) - expected_utility_A(m, p)
     delta corresponds to a change in m/(1-m) set at the top of this file
     """
-    m_ratio = m/(1 - m)
-    shifted_m_ratio = m_ratio * (1 + delta)
-    shifted_m = shifted_m_ratio / (1 + shifted_m_ratio)
-    
-    utility_A = expected_utility_A(m, p, welfare_function,
-                                   bargaining_failure_utility_A,
-                                   bargaining_failure_utility_U)
+    shifted_m = ratio_shifted(m)
+
+    failure_utility_A = bargaining_failure_utility_A(m)
+    bargaining_solution = \
+        find_bargaining_solution(m = m,
+                                 welfare_function = welfare_function,
+                                 bargaining_failure_utility_A = failure_utility_A,
+                                 bargaining_failure_utility_U = bargaining_failure_utility_U(m))
+    utility_A = p * utility_A_from_actions(m, *bargaining_solution) + (1 - p) * failure_utility_A
+    # the problem at shifted_m is close to the one at m, so start from its solution
     shifted_utility_A = expected_utility_A(shifted_m, p, welfare_function,
                                            bargaining_failure_utility_A,
-                                           bargaining_failure_utility_U)
+                                           bargaining_failure_utility_U,
+                                           initial_guess = bargaining_solution)
     return shifted_utility_A - utility_A
 ##
 
@@ -216,17 +1500,16 @@ def expected_utility_A_delta_p(m: float,
     returns expected_utility_A(m, (1 + delta)p) - expected_utility_A(m, p)
     delta corresponds to a change in m/(1-m) set at the top of this file
     """
-    p_ratio = p/(1 - p)
-    shifted_p_ratio = p_ratio * (1 + delta)
-    shifted_p = shifted_p_ratio / (1 + shifted_p_ratio)
-    
-    utility_A = expected_utility_A(m, p, welfare_function,
-                                   bargaining_failure_utility_A,
-                                   bargaining_failure_utility_U)
-    shifted_utility_A = expected_utility_A(m, shifted_p, welfare_function,
-                                           bargaining_failure_utility_A,
-                                           bargaining_failure_utility_U)
-    return shifted_utility_A - utility_A
+    shifted_p = ratio_shifted(p)
+
+    # expected_utility_A is linear in p, so one solve gives the change
+    bargaining_solution = \
+        find_bargaining_solution(m = m,
+                                 welfare_function = welfare_function,
+                                 bargaining_failure_utility_A = bargaining_failure_utility_A(m),
+                                 bargaining_failure_utility_U = bargaining_failure_utility_U(m))
+    success_utility_A = utility_A_from_actions(m, *bargaining_solution)
+    return (shifted_p - p) * (success_utility_A - bargaining_failure_utility_A(m))
 ##
 
 
@@ -266,3 +1549,404 @@ def expected_utility_A_max_shift(m: float,
                                          bargaining_failure_utility_U)
     return max(shift_m, shift_p)
 ##
+
+
+#### expected utilities on a grid of (m, p) ####
+
+"""
+the *_grid functions evaluate the functions above on every pair of
+m_values & p_values, returning an array of shape (len(m_values), len(p_values)).
+
+the bargaining solution depends on m but not p, so it is solved once per m
+(with find_bargaining_solutions) & reused along the whole p axis.
+"""
+
+def bargaining_utilities_A(m_values: np.ndarray,
+                           welfare_function: Callable,
+                           bargaining_failure_utility_A: Callable,
+                           bargaining_failure_utility_U: Callable) -> tuple:
+    """
+    returns (success_utility_A, failure_utility_A), two arrays holding
+    the utility for team aligned when bargaining succeeds & fails at each m.
+    """
+    m_values = np.asarray(m_values, dtype = float)
+    failure_utility_A = np.array([bargaining_failure_utility_A(m) for m in m_values])
+    failure_utility_U = np.array([bargaining_failure_utility_U(m) for m in m_values])
+    bargaining_solutions = find_bargaining_solutions(
+        m_array = m_values,
+        welfare_function = welfare_function,
+        bargaining_failure_utility_A_array = failure_utility_A,
+        bargaining_failure_utility_U_array = failure_utility_U)
+    success_utility_A = utility_A_from_actions_array(m = m_values,
+                                                     action_A = bargaining_solutions[:, 0],
+                                                     action_U = bargaining_solutions[:, 1])
+    return success_utility_A, failure_utility_A
+##
+
+
+def expected_utility_A_grid(m_values: np.ndarray,
+                            p_values: np.ndarray,
+                            welfare_function: Callable,
+                            bargaining_failure_utility_A: Callable,
+                            bargaining_failure_utility_U: Callable) -> np.ndarray:
+    """ grid version of expected_utility_A """
+    success_utility_A, failure_utility_A = \
+        bargaining_utilities_A(m_values, welfare_function,
+                               bargaining_failure_utility_A,
+                               bargaining_failure_utility_U)
+    return _expected_utility_A_grid(p_values, success_utility_A, failure_utility_A)
+##
+
+
+def _expected_utility_A_grid(p_values, success_utility_A, failure_utility_A):
+    p_values = np.asarray(p_values, dtype = float)[None, :]
+    return p_values * success_utility_A[:, None] + \
+        (1 - p_values) * failure_utility_A[:, None]
+##
+
+
+def _expected_utility_A_delta_grids(m_values, p_values, welfare_function,
+                                    bargaining_failure_utility_A,
+                                    bargaining_failure_utility_U,
+                                    derivatives = False) -> tuple:
+    """
+    returns the grid versions of (expected_utility_A_delta_m, expected_utility_A_delta_p),
+    see expected_utility_A_sensitivities.
+    """
+    return expected_utility_A_sensitivities(np.asarray(m_values, dtype = float)[:, None],
+                                            np.asarray(p_values, dtype = float)[None, :],
+                                            welfare_function,
+                                            bargaining_failure_utility_A,
+                                            bargaining_failure_utility_U,
+                                            derivatives = derivatives)
+##
+
+
+def _expected_utility_A_shift_grids(p_values, success_utility_A, failure_utility_A,
+                                    shifted_success_utility_A, shifted_failure_utility_A):
+    """ _expected_utility_A_delta_grids, given the utilities at each m & each shifted m """
+    p_values = np.asarray(p_values, dtype = float)[None, :]
+    shift_m = p_values * (shifted_success_utility_A - success_utility_A)[:, None] + \
+        (1 - p_values) * (shifted_failure_utility_A - failure_utility_A)[:, None]
+    shift_p = (ratio_shifted(p_values) - p_values) * (success_utility_A - failure_utility_A)[:, None]
+    return shift_m, shift_p
+##
+
+
+def expected_utility_A_delta_m_grid(m_values: np.ndarray,
+                                    p_values: np.ndarray,
+                                    welfare_function: Callable,
+                                    bargaining_failure_utility_A: Callable,
+                                    bargaining_failure_utility_U: Callable,
+                                    derivatives: bool = False) -> np.ndarray:
+    """ grid version of expected_utility_A_delta_m """
+    shift_m, _ = _expected_utility_A_delta_grids(m_values, p_values, welfare_function,
+                                                 bargaining_failure_utility_A,
+                                                 bargaining_failure_utility_U,
+                                                 derivatives = derivatives)
+    return shift_m
+##
+
+
+def expected_utility_A_delta_p_grid(m_values: np.ndarray,
+                                    p_values: np.ndarray,
+                                    welfare_function: Callable,
+                                    bargaining_failure_utility_A: Callable,
+                                    bargaining_failure_utility_U: Callable,
+                                    derivatives: bool = False) -> np.ndarray:
+    """ grid version of expected_utility_A_delta_p, needs no solves at shifted m """
+    success_utility_A, failure_utility_A = \
+        bargaining_utilities_A(m_values, welfare_function,
+                               bargaining_failure_utility_A,
+                               bargaining_failure_utility_U)
+    p_values = np.asarray(p_values, dtype = float)[None, :]
+    p_step = p_values * (1 - p_values) if derivatives else ratio_shifted(p_values) - p_values
+    return p_step * (success_utility_A - failure_utility_A)[:, None]
+##
+
+
+def expected_utility_A_shift_ratio_grid(m_values: np.ndarray,
+                                        p_values: np.ndarray,
+                                        welfare_function: Callable,
+                                        bargaining_failure_utility_A: Callable,
+                                        bargaining_failure_utility_U: Callable,
+                                        derivatives: bool = False) -> np.ndarray:
+    """ grid version of expected_utility_A_shift_ratio """
+    shift_m, shift_p = _expected_utility_A_delta_grids(m_values, p_values, welfare_function,
+                                                       bargaining_failure_utility_A,
+                                                       bargaining_failure_utility_U,
+                                                       derivatives = derivatives)
+    return shift_p / shift_m
+##
+
+
+def expected_utility_A_max_shift_grid(m_values: np.ndarray,
+                                      p_values: np.ndarray,
+                                      welfare_function: Callable,
+                                      bargaining_failure_utility_A: Callable,
+                                      bargaining_failure_utility_U: Callable,
+                                      derivatives: bool = False) -> np.ndarray:
+    """ grid version of expected_utility_A_max_shift """
+    shift_m, shift_p = _expected_utility_A_delta_grids(m_values, p_values, welfare_function,
+                                                       bargaining_failure_utility_A,
+                                                       bargaining_failure_utility_U,
+                                                       derivatives = derivatives)
+    return np.maximum(shift_m, shift_p)
+##
+
+
+#### expected utility surfaces ####
+
+"""
+versions of the expected utility functions taking arrays of m & p that
+broadcast against each other (e.g. m_values[:, None] & p_values[None, :]
+for a grid, or equal length arrays of scattered points), returning arrays
+of their broadcast shape. each distinct m is solved once.
+
+the *_grid functions above, with derivatives = True, return derivatives with
+respect to log(m/(1-m)) & log(p/(1-p)) instead of the changes from a delta
+change in them (which they approach, divided by delta, as delta -> 0).
+"""
+
+def bargaining_utilities_A_array(m: np.ndarray,
+                                 welfare_function: Callable,
+                                 bargaining_failure_utility_A: Callable,
+                                 bargaining_failure_utility_U: Callable) -> tuple:
+    """ bargaining_utilities_A for an array of m of any shape, solving each distinct m once """
+    m = np.asarray(m, dtype = float)
+    unique_m_values, inverse = np.unique(m, return_inverse = True)
+    success_utility_A, failure_utility_A = \
+        bargaining_utilities_A(unique_m_values, welfare_function,
+                               bargaining_failure_utility_A,
+                               bargaining_failure_utility_U)
+    return success_utility_A[inverse].reshape(m.shape), failure_utility_A[inverse].reshape(m.shape)
+##
+
+
+def expected_utility_A_surface(m: np.ndarray,
+                               p: np.ndarray,
+                               welfare_function: Callable,
+                               bargaining_failure_utility_A: Callable,
+                               bargaining_failure_utility_U: Callable) -> np.ndarray:
+    """ expected_utility_A at every (m, p) of the broadcast arrays m & p """
+    m, p = np.broadcast_arrays(np.asarray(m, dtype = float), np.asarray(p, dtype = float))
+    success_utility_A, failure_utility_A = \
+        bargaining_utilities_A_array(m, welfare_function,
+                                     bargaining_failure_utility_A,
+                                     bargaining_failure_utility_U)
+    return p * success_utility_A + (1 - p) * failure_utility_A
+##
+
+
+def expected_utility_A_sensitivities(m: np.ndarray,
+                                     p: np.ndarray,
+                                     welfare_function: Callable,
+                                     bargaining_failure_utility_A: Callable,
+                                     bargaining_failure_utility_U: Callable,
+                                     derivatives: bool = False) -> tuple:
+    """
+    returns (expected_utility_A_delta_m, expected_utility_A_delta_p) at every (m, p)
+    of the broadcast arrays m & p.
+
+    expected_utility_A = p * success utility + (1 - p) * failure utility is linear
+    in p, so the change in p needs only the solutions at m, which are shared with
+    the change in m. the solutions at m & at shifted m are found in one batch.
+
+    if derivatives, returns the derivatives of expected_utility_A with respect to
+    log(m/(1-m)) & log(p/(1-p)) instead. the one in p is exact, p (1 - p) times
+    (success utility - failure utility). bargaining solutions have no closed form
+    derivative in m (they can sit on the bounds or where specialLog is flat),
+    so the one in m is a central difference of the solved utilities with a step of
+    derivative_step in log(m/(1-m)).
+    """
+    m, p = np.broadcast_arrays(np.asarray(m, dtype = float), np.asarray(p, dtype = float))
+    if derivatives:
+        shifted_m = [ratio_scaled(m, np.exp(- derivative_step)), ratio_scaled(m, np.exp(derivative_step))]
+    else:
+        shifted_m = [m, ratio_shifted(m)]
+    success_utility_A, failure_utility_A = \
+        bargaining_utilities_A_array(np.stack([m] + shifted_m), welfare_function,
+                                     bargaining_failure_utility_A,
+                                     bargaining_failure_utility_U)
+
+    utility_gain = success_utility_A[0] - failure_utility_A[0]
+    shift_m = p * (success_utility_A[2] - success_utility_A[1]) + \
+        (1 - p) * (failure_utility_A[2] - failure_utility_A[1])
+    if derivatives:
+        return shift_m / (2 * derivative_step), p * (1 - p) * utility_gain
+    return shift_m, (ratio_shifted(p) - p) * utility_gain
+##
+
+
+#### expected utilities under uncertain m & p ####
+
+"""
+expected_utility_A_uncertain treats m & p at each heatmap cell as uncertain,
+log(m/(1-m)) & log(p/(1-p)) normally distributed around the cell's values,
+& estimates the mean, variance & quantiles of expected_utility_A over them
+by (quasi) monte carlo sampling.
+
+every cell is sampled with the same draws, shifted to its m & p, so maps are
+smooth. the sampled m are binned in log(m/(1-m)) & each bin is solved once, for
+all cells & batches. expected_utility_A is linear in p, so the p samples of a
+cell are mixed with the utilities at its m samples without further solves.
+cells stop sampling once the standard error of their mean is small enough.
+"""
+
+monte_carlo_m_spread = 0.5 # standard deviation of log(m/(1-m)) around each cell's m
+monte_carlo_p_spread = 0.5 # standard deviation of log(p/(1-p)) around each cell's p
+monte_carlo_sampling = 'sobol' # 'sobol' (scrambled quasi-random points) or 'random'
+monte_carlo_batch_size = 256 # samples per cell drawn at a time, a power of 2 keeps sobol points balanced
+monte_carlo_max_samples = 4096 # most samples drawn per cell
+monte_carlo_tolerance = 1e-2 # cells stop once the standard error of their mean is below this fraction of it
+monte_carlo_m_bin_width = 1e-2 # sampled log(m/(1-m)) are rounded to multiples of this, so nearby samples
+                               # share a solve, 0 = solve every distinct sampled m
+monte_carlo_quantiles = (0.05, 0.5, 0.95)
+
+def expected_utility_A_uncertain(m_values: np.ndarray,
+                                 p_values: np.ndarray,
+                                 welfare_function: Callable,
+                                 bargaining_failure_utility_A: Callable,
+                                 bargaining_failure_utility_U: Callable,
+                                 m_spread: float = None,
+                                 p_spread: float = None,
+                                 quantiles: tuple = None,
+                                 seed: int = 0) -> dict:
+    """
+    returns a dict of len(m_values) * len(p_values) arrays, for uncertain m & p
+    centred on each pair of m_values & p_values (see above):
+
+    'mean'      = estimated mean of expected_utility_A
+    'variance'  = estimated variance of expected_utility_A
+    'quantiles' = array of shape (len(quantiles), len(m_values), len(p_values)),
+                  the estimated quantiles of expected_utility_A
+    'samples'   = number of samples drawn
+    'converged' = whether the standard error of the mean met monte_carlo_tolerance
+                  within monte_carlo_max_samples
+
+    m_spread, p_spread & quantiles default to the monte_carlo_* settings, a spread
+    of 0 makes that variable certain. standard errors are those of independent
+    samples, which overestimate them for sobol points.
+    """
+    m_spread = monte_carlo_m_spread if m_spread is None else m_spread
+    p_spread = monte_carlo_p_spread if p_spread is None else p_spread
+    quantiles = monte_carlo_quantiles if quantiles is None else quantiles
+    m_log_odds = np.log(np.asarray(m_values, dtype = float)) - np.log1p(- np.asarray(m_values, dtype = float))
+    p_log_odds = np.log(np.asarray(p_values, dtype = float)) - np.log1p(- np.asarray(p_values, dtype = float))
+    shape = (len(m_log_odds), len(p_log_odds))
+    next_draws = _monte_carlo_draws(seed)
+
+    samples = np.zeros(shape, dtype = int)
+    mean = np.zeros(shape)
+    squared_deviations = np.zeros(shape)
+    converged = np.zeros(shape, dtype = bool)
+    solved_utilities = {'log_odds': np.zeros(0), 'success': np.zeros(0), 'failure': np.zeros(0)}
+    batches = [] # (flat indices of the cells sampled, their samples)
+
+    active_cells = np.arange(mean.size)
+    while active_cells.size > 0:
+        m_draws, p_draws = next_draws(monte_carlo_batch_size)
+        rows, columns = np.unravel_index(active_cells, shape)
+        active_rows, row_indices = np.unique(rows, return_inverse = True)
+
+        sampled_m_log_odds = m_log_odds[active_rows, None] + m_spread * m_draws[None, :]
+        success_utility_A, failure_utility_A = \
+            _binned_bargaining_utilities_A(sampled_m_log_odds, solved_utilities, welfare_function,
+                                           bargaining_failure_utility_A, bargaining_failure_utility_U)
+        sampled_p = 1 / (1 + np.exp(- (p_log_odds[columns, None] + p_spread * p_draws[None, :])))
+        batch = sampled_p * success_utility_A[row_indices] + (1 - sampled_p) * failure_utility_A[row_indices]
+        batches.append((active_cells, batch))
+
+        # combine the batch's mean & variance with the running ones (chan et al.)
+        n = samples.flat[active_cells]
+        batch_mean = np.mean(batch, axis = 1)
+        difference = batch_mean - mean.flat[active_cells]
+        total = n + batch.shape[1]
+        mean.flat[active_cells] += difference * batch.shape[1] / total
+        squared_deviations.flat[active_cells] += np.sum((batch - batch_mean[:, None]) ** 2, axis = 1) + \
+            difference ** 2 * n * batch.shape[1] / total
+        samples.flat[active_cells] = total
+
+        standard_error = np.sqrt(squared_deviations.flat[active_cells] / (total - 1) / total)
+        done = standard_error <= monte_carlo_tolerance * np.abs(mean.flat[active_cells])
+        converged.flat[active_cells[done]] = True
+        active_cells = active_cells[~done & (total + monte_carlo_batch_size <= monte_carlo_max_samples)]
+
+    return {'mean': mean,
+            'variance': squared_deviations / np.maximum(samples - 1, 1),
+            'quantiles': _monte_carlo_quantiles(batches, samples, quantiles),
+            'samples': samples,
+            'converged': converged}
+##
+
+
+def _monte_carlo_draws(seed):
+    """ returns a function drawing (m draws, p draws), two arrays of n standard normal samples """
+    if monte_carlo_sampling == 'sobol':
+        from scipy.stats import qmc
+        from scipy.special import ndtri
+        sampler = qmc.Sobol(d = 2, seed = seed)
+        return lambda n: tuple(ndtri(sampler.random(n)).T)
+    random_generator = np.random.default_rng(seed)
+    return lambda n: tuple(random_generator.standard_normal((2, n)))
+##
+
+
+def _binned_bargaining_utilities_A(m_log_odds, solved_utilities, welfare_function,
+                                   bargaining_failure_utility_A, bargaining_failure_utility_U):
+    """
+    bargaining_utilities_A at m with the (binned) log odds m_log_odds, an array of any shape,
+    solving only the bins not already in solved_utilities & adding them to it
+    """
+    if monte_carlo_m_bin_width > 0:
+        m_log_odds = np.round(m_log_odds / monte_carlo_m_bin_width) * monte_carlo_m_bin_width
+    bins = np.unique(m_log_odds)
+    solved_bins = solved_utilities['log_odds']
+    new_bins = bins[~np.isin(bins, solved_bins)]
+    if new_bins.size > 0:
+        success_utility_A, failure_utility_A = \
+            bargaining_utilities_A(1 / (1 + np.exp(- new_bins)), welfare_function,
+                                   bargaining_failure_utility_A, bargaining_failure_utility_U)
+        order = np.argsort(np.concatenate([solved_bins, new_bins]))
+        solved_utilities['log_odds'] = np.concatenate([solved_bins, new_bins])[order]
+        solved_utilities['success'] = np.concatenate([solved_utilities['success'], success_utility_A])[order]
+        solved_utilities['failure'] = np.concatenate([solved_utilities['failure'], failure_utility_A])[order]
+
+    indices = np.searchsorted(solved_utilities['log_odds'], m_log_odds)
+    return solved_utilities['success'][indices], solved_utilities['failure'][indices]
+##
+
+
+def _monte_carlo_quantiles(batches, samples, quantiles):
+    """ the quantiles of each cell's samples, kept in batches by expected_utility_A_uncertain """
+    result = np.zeros((len(quantiles),) + samples.shape)
+    n_batches = samples // monte_carlo_batch_size
+    # the cells sampled shrink from batch to batch, so cells with the same number of batches
+    # were sampled in the same ones
+    for n in np.unique(n_batches):
+        cells = np.flatnonzero(n_batches == n)
+        cell_samples = np.concatenate([batch[np.searchsorted(batch_cells, cells)]
+                                       for batch_cells, batch in batches[:n]], axis = 1)
+        result.reshape(len(quantiles), -1)[:, cells] = np.quantile(cell_samples, quantiles, axis = 1)
+    return result
+##
+
+
+def log_quantity(m, p,
+                 quantity_function: Callable,
+                 welfare_function: Callable,
+                 bargaining_failure_utility_A: Callable,
+                 bargaining_failure_utility_U: Callable):
+    """
+    returns the log of quantity_function(m, p, ...), where quantity_function
+    is one of the expected utility functions above (scalar or grid version).
+
+    used with functools.partial to make heatmap fill functions that can be
+    sent to worker processes.
+    """
+    result = quantity_function(m, p,
+                               welfare_function = welfare_function,
+                               bargaining_failure_utility_A = bargaining_failure_utility_A,
+                               bargaining_failure_utility_U = bargaining_failure_utility_U)
+    return np.log(result)
+##
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import json
+import socket
+import numpy as np
+import maths
+import sweep
+
+"""
+a local server computing heatmap grids for many clients at once, run with e.g.
+
+python server.py --address localhost:8765 --workers 4
+
+and use it from main.py by setting server_address, or from sweep.py with --server.
+addresses are 'host:port' or the path of a unix socket.
+
+bargaining problems are solved by a pool of worker processes, and every
+solution is kept in one cache shared by all clients, so a problem (N, welfare
+function, solver settings, disagreement outcome, m) is solved once however many jobs need it,
+including jobs from different clients asking for it at the same time.
+
+the protocol is one json object per line. a client sends one job,
+{"job": "heatmap", "config": config, "rows": [rows to compute, default all]} or
+{"job": "sweep", "configs": [config, ...]}
+with configs in the format of main.py's heatmap_config (or sweep.sweep_configs),
+and is sent {"config": index in configs, "row": row, "values": [log(quantity), ...]}
+for each row of each grid as soon as it is computed (in no particular order),
+then {"done": true, "solved": problems solved, "reused": problems found in the cache},
+or {"error": message} if the job can't be done.
+"""
+
+default_address = 'localhost:8765'
+server_workers = 4 # worker processes solving bargaining problems
+server_block_rows = 4 # rows whose problems are sent to a worker together
+server_cache_size = 2 ** 20 # max number of solved bargaining problems kept, for all clients
+
+_solutions = OrderedDict() # (N, welfare function name, solver settings, outcome, m) -> future of (success utility A, failure utility A)
+_executor = None
+
+
+#### server ####
+
+async def start_server(address: str = default_address,
+                       workers: int = None) -> asyncio.AbstractServer:
+    """ starts serving jobs at address (port 0 picks a free one), returns the asyncio server """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+    _executor = ProcessPoolExecutor(max_workers = server_workers if workers is None else workers)
+
+    host, port, path = _parse_address(address)
+    if path is not None:
+        return await asyncio.start_unix_server(_handle_client, path = path, limit = 2 ** 26)
+    return await asyncio.start_server(_handle_client, host, port, limit = 2 ** 26)
+##
+
+
+async def serve(address: str = default_address,
+                workers: int = None) -> None:
+    """ serves jobs at address until cancelled """
+    server = await start_server(address, workers)
+    async with server:
+        await server.serve_forever()
+##
+
+
+async def _handle_client(reader, writer):
+    write_lock = asyncio.Lock()
+    async def send(message):
+        writer.write((json.dumps(message) + '\n').encode())
+        async with write_lock:
+            await writer.drain()
+
+    try:
+        request = json.loads(await reader.readline())
+        if request.get('job') == 'heatmap':
+            configs = [request['config']]
+            rows = request.get('rows')
+        elif request.get('job') == 'sweep':
+            configs = request['configs']
+            rows = None
+        else:
+            raise ValueError(f'unknown job {request.get("job")!r}, expected "heatmap" or "sweep"')
+        for config in configs:
+            _check_config(config)
+
+        counts = {'solved': 0, 'reused': 0}
+        await asyncio.gather(*(_grid_rows(config_index, config, rows, send, counts)
+                               for config_index, config in enumerate(configs)))
+        await send(dict(counts, done = True))
+    except ConnectionError:
+        pass # client went away, solutions already started still fill the cache
+    except Exception as error:
+        await send({'error': f'{type(error).__name__}: {error}'})
+    finally:
+        writer.close()
+##
+
+
+def _check_config(config):
+    """ raises a ValueError if the server can't compute the grid for config """
+    if config['welfare_function'] not in sweep.welfare_functions:
+        raise ValueError(f'unknown welfare function {config["welfare_function"]!r}')
+    if config['quantity_to_plot'] not in sweep.quantities:
+        raise ValueError(f'unknown quantity {config["quantity_to_plot"]!r}')
+    if config['disagreement_outcome'] not in maths.bargaining_failure_utilities:
+        raise ValueError(f'unknown disagreement outcome {config["disagreement_outcome"]!r}')
+    if not config['grid_evaluation'] or config['adaptive_refinement']:
+        raise ValueError('only grid evaluation without adaptive refinement is computed by the server')
+##
+
+
+async def _grid_rows(config_index, config, rows, send, counts):
+    """ sends the rows of the grid for config, in blocks of server_block_rows as they are computed """
+    m_values, p_values = sweep._axes(config)
+    if rows is None:
+        rows = range(len(m_values))
+    rows = np.array(rows, dtype = int)
+
+    async def send_block(block_rows):
+        block_m_values = m_values[block_rows]
+        needed_m_values = list(block_m_values)
+        if config['quantity_to_plot'] not in sweep.unshifted_quantities:
+            needed_m_values += list(sweep._shifted_m_values(config, block_m_values))
+        utilities = await _utilities(config['N'], config['welfare_function'], config['solver_settings'],
+                                     config['disagreement_outcome'], needed_m_values, counts)
+        with sweep._maths_settings(N = config['N']):
+            block = sweep._quantity_grid(config, block_m_values, p_values, utilities)
+        for row, values in zip(block_rows, block):
+            await send({'config': config_index, 'row': int(row), 'values': values.tolist()})
+
+    await asyncio.gather(*(send_block(rows[k:k + server_block_rows])
+                           for k in range(0, len(rows), server_block_rows)))
+##
+
+
+async def _utilities(N, welfare_function_name, solver_settings, outcome, m_values, counts):
+    """
+    returns a dict mapping (outcome, m) to (success utility A, failure utility A),
+    as sweep._quantity_grid takes, for each m in m_values. problems not in the cache
+    (& not already being solved for another job) are solved together by a worker.
+    """
+    settings_key = json.dumps(solver_settings, sort_keys = True)
+    keys = list(dict.fromkeys((N, welfare_function_name, settings_key, outcome, m) for m in m_values))
+    missing = [key for key in keys if key not in _solutions]
+    counts['solved'] += len(missing)
+    counts['reused'] += len(keys) - len(missing)
+
+    loop = asyncio.get_running_loop()
+    for key in missing:
+        _solutions[key] = loop.create_future()
+    for key in keys:
+        _solutions.move_to_end(key)
+    futures = [_solutions[key] for key in keys] # still awaited if evicted
+    missing_futures = [_solutions[key] for key in missing]
+    _evict_solutions()
+
+    if missing:
+        missing_m_values = np.array([key[4] for key in missing])
+        try:
+            success_utilities_A, failure_utilities_A = await loop.run_in_executor(
+                _executor, _solve_problems, N, welfare_function_name, solver_settings, outcome, missing_m_values)
+        except Exception as error:
+            # fails every job waiting for these problems, which are solved again when next needed
+            for key, future in zip(missing, missing_futures):
+                if _solutions.get(key) is future:
+                    del _solutions[key]
+                future.set_exception(error)
+        else:
+            for future, success_utility_A, failure_utility_A in zip(missing_futures, success_utilities_A,
+                                                                    failure_utilities_A):
+                future.set_result((float(success_utility_A), float(failure_utility_A)))
+
+    utilities = await asyncio.gather(*futures)
+    return {(outcome, key[4]): utility for key, utility in zip(keys, utilities)}
+##
+
+
+def _evict_solutions():
+    """ drops the least recently used solved problems beyond server_cache_size """
+    while len(_solutions) > server_cache_size:
+        oldest_key = next(iter(_solutions))
+        if not _solutions[oldest_key].done():
+            break # being solved, & so recently used
+        del _solutions[oldest_key]
+##
+
+
+def _solve_problems(N, welfare_function_name, solver_settings, outcome, m_values):
+    """
+    the success & failure utilities of A for a batch of problems, run in the worker processes
+    (so the failure utilities, which depend on N, are computed under the problems' N too)
+    """
+    with sweep._maths_settings(N = N, **solver_settings):
+        failure_utility_A, failure_utility_U = maths.bargaining_failure_utilities[outcome]
+        failure_utilities_A = np.array([failure_utility_A(m) for m in m_values])
+        failure_utilities_U = np.array([failure_utility_U(m) for m in m_values])
+        solutions = maths.find_bargaining_solutions(m_array = m_values,
+                                                    welfare_function = sweep.welfare_functions[welfare_function_name],
+                                                    bargaining_failure_utility_A_array = failure_utilities_A,
+                                                    bargaining_failure_utility_U_array = failure_utilities_U)
+        success_utilities_A = maths.utility_A_from_actions_array(m = m_values,
+                                                                 action_A = solutions[:, 0],
+                                                                 action_U = solutions[:, 1])
+        return success_utilities_A, failure_utilities_A
+##
+
+
+def _parse_address(address):
+    """ (host, port, None) for 'host:port' addresses, (None, None, path) for unix socket paths """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port), None
+    return None, None, address
+##
+
+
+#### clients ####
+
+def request_rows(job: dict,
+                 address: str = default_address):
+    """
+    sends job (see the protocol above) to the server at address,
+    yields (config index, row, row values) as rows arrive,
+    & returns the server's final counts of solved & reused problems.
+    raises a RuntimeError if the server can't do the job.
+    """
+    host, port, path = _parse_address(address)
+    if path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+    else:
+        connection = socket.create_connection((host, port))
+    with connection, connection.makefile('rwb') as stream:
+        stream.write((json.dumps(job) + '\n').encode())
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if 'error' in message:
+                raise RuntimeError(f'server could not do job: {message["error"]}')
+            if message.get('done'):
+                return {'solved': message['solved'], 'reused': message['reused']}
+            yield message['config'], message['row'], np.array(message['values'], dtype = float)
+    raise ConnectionError(f'server at {address} closed the connection before finishing the job')
+##
+
+
+def request_heatmap_values(config: dict,
+                           vals: np.ndarray,
+                           done: np.ndarray,
+                           address: str = default_address):
+    """
+    fills the rows of vals (& done, e.g. from store.open_checkpoint) that are not done
+    with the grid for config computed by the server at address,
+    yielding the index of each row as it is filled,
+    like heatmaps.compute_heatmap_values_streaming (& flushing memory-mapped
+    vals & done after each row like it, so an interrupted job can resume).
+    """
+    rows = [int(row) for row in np.flatnonzero(~np.all(done, axis = 1))]
+    if not rows:
+        return
+    for _, row, values in request_rows({'job': 'heatmap', 'config': config, 'rows': rows}, address):
+        # values first, so rows are only marked done once their values are on disk
+        vals[row] = values
+        if isinstance(vals, np.memmap):
+            vals.flush()
+        done[row] = True
+        if isinstance(done, np.memmap):
+            done.flush()
+        yield row
+##
+
+
+def request_sweep(configs: list,
+                  address: str = default_address) -> list:
+    """ returns the grid for each configuration in configs, like sweep.run_sweep, computed by the server """
+    grids = [np.full((config['resolution'], config['resolution']), np.nan) for config in configs]
+    for config_index, row, values in request_rows({'job': 'sweep', 'configs': configs}, address):
+        grids[config_index][row] = values
+    return grids
+##
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'serve heatmap & sweep jobs, sharing solutions between clients')
+    parser.add_argument('--address', default = default_address,
+                        help = "'host:port' or the path of a unix socket to listen on")
+    parser.add_argument('--workers', type = int, default = server_workers,
+                        help = 'worker processes solving bargaining problems')
+    args = parser.parse_args()
+
+    print(f'serving at {args.address}')
+    try:
+        asyncio.run(serve(args.address, args.workers))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+"""
+on-disk store for computed heatmap grids, so that rerunning with the same
+configuration loads the grid instead of recomputing it.
+
+each grid is saved under a key made by hashing its configuration
+(every input that changes the numbers, but nothing that only changes the
+plot), as three files in store_directory:
+
+<key>.npy      = the grid of values, loaded memory-mapped
+<key>_axes.npz = m_values & p_values
+<key>.json     = the configuration & grid shape, for humans & sanity checks
+
+grids can also be computed in place in a checkpoint (see open_checkpoint),
+<key>_partial.npy = the memory-mapped grid being computed
+<key>_done.npy    = memory-mapped bitmap of the cells computed so far
+which finish_checkpoint turns into a stored grid once every cell is done.
+"""
+
+def config_key(config: dict) -> str:
+    """ returns a hash of config (a dict of json serializable values) """
+    config_json = json.dumps(config, sort_keys = True)
+    return hashlib.sha256(config_json.encode()).hexdigest()[:32]
+##
+
+
+def save_grid(store_directory: str,
+              config: dict,
+              vals: np.ndarray,
+              m_values: np.ndarray,
+              p_values: np.ndarray) -> str:
+    """ saves a grid computed with config, returns its key """
+    os.makedirs(store_directory, exist_ok = True)
+    key = config_key(config)
+    path = os.path.join(store_directory, key)
+
+    # write the metadata sidecar last, so a grid only counts as stored once it is complete
+    np.save(path + '.npy', np.asarray(vals))
+    np.savez(path + '_axes.npz',
+             m_values = np.asarray(m_values),
+             p_values = np.asarray(p_values))
+    with open(path + '.json', 'w') as metadata_file:
+        json.dump({'config': config, 'shape': list(np.shape(vals))},
+                  metadata_file, sort_keys = True, indent = 2)
+    return key
+##
+
+
+def load_grid(store_directory: str,
+              config: dict) -> tuple:
+    """
+    returns (vals, m_values, p_values) for a grid saved with config,
+    or None if there is none. vals is memory-mapped read only.
+    """
+    path = os.path.join(store_directory, config_key(config))
+    if not os.path.exists(path + '.json'):
+        return None
+
+    with open(path + '.json') as metadata_file:
+        metadata = json.load(metadata_file)
+    if metadata['config'] != json.loads(json.dumps(config)):
+        return None # hash collision
+
+    vals = np.load(path + '.npy', mmap_mode = 'r')
+    with np.load(path + '_axes.npz') as axes:
+        m_values = axes['m_values']
+        p_values = axes['p_values']
+    return vals, m_values, p_values
+##
+
+
+def open_checkpoint(store_directory: str,
+                    config: dict,
+                    m_values: np.ndarray,
+                    p_values: np.ndarray) -> tuple:
+    """
+    returns (vals, done), memory-mapped arrays to compute the grid for config in,
+    vals a len(m_values) * len(p_values) array of values & done the bitmap of which
+    cells have been computed. if a checkpoint for config exists (e.g. from an
+    interrupted run) it is reopened, so computing can resume from the cells not done.
+    """
+    os.makedirs(store_directory, exist_ok = True)
+    path = os.path.join(store_directory, config_key(config))
+    shape = (len(m_values), len(p_values))
+
+    # a checkpoint missing any of its files (e.g. after a crash while creating it) is started afresh
+    if all(os.path.exists(path + suffix) for suffix in ('_axes.npz', '_partial.npy', '_done.npy')):
+        with np.load(path + '_axes.npz') as axes:
+            same_axes = np.array_equal(axes['m_values'], m_values) and \
+                np.array_equal(axes['p_values'], p_values)
+        if same_axes:
+            vals = np.load(path + '_partial.npy', mmap_mode = 'r+')
+            done = np.load(path + '_done.npy', mmap_mode = 'r+')
+            return vals, done
+
+    np.savez(path + '_axes.npz',
+             m_values = np.asarray(m_values),
+             p_values = np.asarray(p_values))
+    vals = np.lib.format.open_memmap(path + '_partial.npy', mode = 'w+', dtype = float, shape = shape)
+    done = np.lib.format.open_memmap(path + '_done.npy', mode = 'w+', dtype = bool, shape = shape)
+    vals[:] = np.nan
+    vals.flush()
+    return vals, done
+##
+
+
+def finish_checkpoint(store_directory: str,
+                      config: dict) -> tuple:
+    """
+    turns the checkpoint for config into a stored grid once every cell is done,
+    returns (vals, m_values, p_values) like load_grid, or None if cells are missing
+    """
+    path = os.path.join(store_directory, config_key(config))
+    done = np.load(path + '_done.npy', mmap_mode = 'r')
+    shape = done.shape
+    if not np.all(done):
+        return None
+    del done
+
+    os.replace(path + '_partial.npy', path + '.npy')
+    with open(path + '.json', 'w') as metadata_file:
+        json.dump({'config': config, 'shape': list(shape)},
+                  metadata_file, sort_keys = True, indent = 2)
+    os.remove(path + '_done.npy')
+    return load_grid(store_directory, config)
+##
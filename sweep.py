@@ -0,0 +1,257 @@
+import argparse
+from contextlib import contextmanager
+from itertools import product
+import json
+import numpy as np
+import maths
+import heatmaps
+from store import load_grid, save_grid
+
+"""
+parameter studies over many heatmap configurations at once, run with e.g.
+
+python sweep.py --N 1e20 1e22 --welfare-function nash ks --disagreement-outcome 0 1 2
+
+each configuration is a dict in the same format as main.py's heatmap_config,
+so grids stored by a sweep are loaded by main.py (and vice versa).
+
+all configurations with the same N & welfare function are solved in one
+batched call of maths.find_bargaining_solutions, with every (m, failure
+utility A, failure utility U) problem they need solved only once, however
+many quantities, deltas or disagreement outcomes share it.
+"""
+
+welfare_functions = {'nash': maths.nash_welfare_function,
+                     'ks': maths.ks_welfare_function}
+
+# quantity name -> function of (shift_m, shift_p) grids, or None for expected_utility_A itself
+quantities = {'expected_utility_A': None,
+              'expected_utility_A_delta_m': lambda shift_m, shift_p: shift_m,
+              'expected_utility_A_delta_p': lambda shift_m, shift_p: shift_p,
+              'expected_utility_A_shift_ratio': lambda shift_m, shift_p: shift_p / shift_m,
+              'expected_utility_A_max_shift': np.maximum}
+
+# quantities that need no solves at shifted m
+unshifted_quantities = ('expected_utility_A', 'expected_utility_A_delta_p')
+
+
+def sweep_configs(N_values: list = None,
+                  deltas: list = None,
+                  welfare_function_names: list = None,
+                  disagreement_outcomes: list = None,
+                  quantity_names: list = None) -> list:
+    """
+    returns the configuration dicts for every combination of the given values,
+    each defaulting to the current setting (or all choices, for welfare functions,
+    disagreement outcomes & quantities). axes are heatmaps' current axes &
+    solver settings maths' current ones (see maths.solver_settings).
+    """
+    if N_values is None:
+        N_values = [maths.N]
+    if deltas is None:
+        deltas = [maths.delta]
+    if welfare_function_names is None:
+        welfare_function_names = list(welfare_functions)
+    if disagreement_outcomes is None:
+        disagreement_outcomes = list(maths.bargaining_failure_utilities)
+    if quantity_names is None:
+        quantity_names = list(quantities)
+
+    return [{'N': N,
+             'delta': delta,
+             'quantity_to_plot': quantity_name,
+             'welfare_function': welfare_function_name,
+             'disagreement_outcome': disagreement_outcome,
+             'grid_evaluation': True,
+             'adaptive_refinement': False,
+             'adaptive_tolerance': None,
+             'adaptive_initial_step': None,
+             'resolution': heatmaps.resolution,
+             'min_m_ratio': heatmaps.min_m_ratio,
+             'max_m_ratio': heatmaps.max_m_ratio,
+             'min_p': heatmaps.min_p,
+             'max_p': heatmaps.max_p,
+             'solver_settings': maths.solver_settings()}
+            for N, delta, welfare_function_name, disagreement_outcome, quantity_name
+            in product(N_values, deltas, welfare_function_names, disagreement_outcomes, quantity_names)]
+##
+
+
+@contextmanager
+def _maths_settings(**settings):
+    """ temporarily sets maths' module level settings, e.g. N & delta """
+    defaults = {name: getattr(maths, name) for name in settings}
+    for name, value in settings.items():
+        setattr(maths, name, value)
+    try:
+        yield
+    finally:
+        for name, value in defaults.items():
+            setattr(maths, name, value)
+##
+
+
+def run_sweep(configs: list,
+              results_directory: str = None) -> list:
+    """
+    returns the grid of log(quantity) for each configuration in configs
+    (e.g. from sweep_configs), in order, evaluated on the default axes
+    for the configuration's resolution & ranges.
+
+    if results_directory is given, grids already stored there are loaded
+    instead of computed & the computed ones are stored.
+    """
+    grids = [None] * len(configs)
+    if results_directory is not None:
+        for k, config in enumerate(configs):
+            stored_grid = load_grid(results_directory, config)
+            if stored_grid is not None:
+                grids[k] = np.asarray(stored_grid[0])
+
+    # configs sharing N, the welfare function, the axes & solver settings can be solved together
+    groups = {}
+    for k, config in enumerate(configs):
+        if grids[k] is None:
+            group_key = (config['N'], config['welfare_function'], config['resolution'],
+                         config['min_m_ratio'], config['max_m_ratio'], config['min_p'], config['max_p'],
+                         json.dumps(config['solver_settings'], sort_keys = True))
+            groups.setdefault(group_key, []).append(k)
+
+    for (N, welfare_function_name, *_), group in groups.items():
+        m_values, p_values = _axes(configs[group[0]])
+        with _maths_settings(N = N, **configs[group[0]]['solver_settings']):
+            utilities = _solve_group([configs[k] for k in group], m_values,
+                                     welfare_functions[welfare_function_name])
+            for k in group:
+                grids[k] = _quantity_grid(configs[k], m_values, p_values, utilities)
+                if results_directory is not None:
+                    save_grid(results_directory, configs[k], grids[k], m_values, p_values)
+    return grids
+##
+
+
+def _axes(config):
+    resolution = heatmaps.resolution
+    heatmaps.resolution = config['resolution']
+    try:
+        m_values = heatmaps.default_m_values(config['min_m_ratio'], config['max_m_ratio'])
+        p_values = heatmaps.default_p_values(config['min_p'], config['max_p'])
+    finally:
+        heatmaps.resolution = resolution
+    return m_values, p_values
+##
+
+
+def _shifted_m_values(config, m_values):
+    with _maths_settings(delta = config['delta']):
+        return maths.ratio_shifted(m_values)
+##
+
+
+def _solve_group(configs, m_values, welfare_function):
+    """
+    solves every bargaining problem needed by configs (which share N & the
+    welfare function) in one batch, returns a dict mapping
+    (disagreement outcome, m) to (success utility A, failure utility A)
+    """
+    m_needed = {}
+    for config in configs:
+        outcome = config['disagreement_outcome']
+        m_needed.setdefault(outcome, set()).update(m_values)
+        if config['quantity_to_plot'] not in unshifted_quantities:
+            m_needed[outcome].update(_shifted_m_values(config, m_values))
+
+    problems = []
+    problem_outcomes = []
+    for outcome, outcome_m_values in m_needed.items():
+        failure_utility_A, failure_utility_U = maths.bargaining_failure_utilities[outcome]
+        problems += [(m, failure_utility_A(m), failure_utility_U(m)) for m in sorted(outcome_m_values)]
+        problem_outcomes += [outcome] * len(outcome_m_values)
+    problems = np.array(problems, dtype = float)
+
+    # identical problems from different outcomes are solved once
+    unique_problems, problem_indices = np.unique(problems, axis = 0, return_inverse = True)
+    solutions = maths.find_bargaining_solutions(m_array = unique_problems[:, 0],
+                                                welfare_function = welfare_function,
+                                                bargaining_failure_utility_A_array = unique_problems[:, 1],
+                                                bargaining_failure_utility_U_array = unique_problems[:, 2])
+    success_utility_A = maths.utility_A_from_actions_array(m = unique_problems[:, 0],
+                                                           action_A = solutions[:, 0],
+                                                           action_U = solutions[:, 1])
+
+    utilities = {}
+    for outcome, problem, unique_index in zip(problem_outcomes, problems, np.ravel(problem_indices)):
+        utilities[outcome, problem[0]] = (success_utility_A[unique_index], problem[1])
+    return utilities
+##
+
+
+def _quantity_grid(config, m_values, p_values, utilities):
+    """ the grid of log(quantity) for config, from the utilities found by _solve_group """
+    outcome = config['disagreement_outcome']
+    def utilities_A(m_values):
+        success_utility_A, failure_utility_A = zip(*[utilities[outcome, m] for m in m_values])
+        return np.array(success_utility_A), np.array(failure_utility_A)
+
+    success_utility_A, failure_utility_A = utilities_A(m_values)
+    quantity = quantities[config['quantity_to_plot']]
+    if quantity is None:
+        return np.log(maths._expected_utility_A_grid(p_values, success_utility_A, failure_utility_A))
+
+    if config['quantity_to_plot'] in unshifted_quantities:
+        # shifted m utilities are not solved for, & not used
+        shifted_utilities_A = (success_utility_A, failure_utility_A)
+    else:
+        shifted_utilities_A = utilities_A(_shifted_m_values(config, m_values))
+    with _maths_settings(delta = config['delta']):
+        shift_m, shift_p = maths._expected_utility_A_shift_grids(p_values, success_utility_A, failure_utility_A,
+                                                                 *shifted_utilities_A)
+    return np.log(quantity(shift_m, shift_p))
+##
+
+
+def _N_value(value):
+    """ parses N, as an int where possible so configs match main.py's """
+    N = float(value)
+    return int(N) if N.is_integer() else N
+##
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'compute heatmap grids for every combination of settings')
+    parser.add_argument('--N', type = _N_value, nargs = '+', default = [maths.N],
+                        help = 'amounts of resources avaliable to each team')
+    parser.add_argument('--delta', type = float, nargs = '+', default = [maths.delta],
+                        help = 'changes in m or p depicted')
+    parser.add_argument('--welfare-function', nargs = '+', choices = list(welfare_functions),
+                        default = list(welfare_functions))
+    parser.add_argument('--disagreement-outcome', type = int, nargs = '+',
+                        choices = list(maths.bargaining_failure_utilities),
+                        default = list(maths.bargaining_failure_utilities))
+    parser.add_argument('--quantity', nargs = '+', choices = list(quantities),
+                        default = ['expected_utility_A', 'expected_utility_A_shift_ratio',
+                                   'expected_utility_A_max_shift'])
+    parser.add_argument('--resolution', type = int, default = heatmaps.resolution)
+    parser.add_argument('--results-directory', default = 'results',
+                        help = 'where grids are stored, see store.py')
+    parser.add_argument('--server', default = None,
+                        help = "address ('host:port' or unix socket path) of a server.py to compute the grids on")
+    args = parser.parse_args()
+
+    heatmaps.resolution = args.resolution
+    configs = sweep_configs(N_values = args.N,
+                            deltas = args.delta,
+                            welfare_function_names = args.welfare_function,
+                            disagreement_outcomes = args.disagreement_outcome,
+                            quantity_names = args.quantity)
+    if args.server is not None:
+        from server import request_sweep
+        for config, grid in zip(configs, request_sweep(configs, args.server)):
+            save_grid(args.results_directory, config, grid, *_axes(config))
+        print(f'{len(configs)} grids computed by the server at {args.server}, '
+              f'stored in {args.results_directory}')
+    else:
+        with maths.instrumentation() as stats:
+            grids = run_sweep(configs, results_directory = args.results_directory)
+        print(f'{len(configs)} grids, {maths.fresh_solves(stats)} bargaining problems solved, '
+              f'stored in {args.results_directory}')
@@ -1,5 +1,5 @@
 
-from thing import *
+from maths import *
 import numpy as np
 
 ### test utils ###
@@ -103,3 +103,528 @@ utility_U = utility_U_from_actions(m = m,
 
 np.testing.assert_almost_equal(utility_A, utility_U, decimal = 2)
 assert sloppy_pareto_optimal(m, action_A, action_U)
+
+
+# KS ideal point is computed in closed form, expect it to match
+# the numerical maximum of each team's utility, & be (log10 N, log10 N) for every m
+def utility_A_welfare_func(m, action_A, action_U, **extras):
+    return utility_A_from_actions(m, action_A, action_U)
+
+m = 0.3
+best_action_profile_for_A = find_bargaining_solution(
+    m = m,
+    welfare_function = utility_A_welfare_func,
+    bargaining_failure_utility_A = 0,
+    bargaining_failure_utility_U = 0
+)
+best_utility_A, best_utility_U = ks_ideal_point(m)
+np.testing.assert_almost_equal(best_utility_A,
+                               utility_A_from_actions(m, *best_action_profile_for_A),
+                               decimal = 3)
+for m in [0.01, 0.3, 0.5, 0.99]:
+    np.testing.assert_allclose(ks_ideal_point(m), (22., 22.))
+np.testing.assert_allclose(ks_ideal_point_array(np.array([0.1, 0.9])), [[22., 22.], [22., 22.]])
+import maths
+default_N = maths.N
+maths.N = 10 ** 10
+np.testing.assert_allclose(ks_ideal_point(0.3), (10., 10.))
+maths.N = default_N
+
+# the KS solution of a symmetric problem should treat both teams equally
+ks_solution = find_bargaining_solution(0.5, ks_welfare_function, 0., 0.)
+np.testing.assert_allclose(ks_solution, [0.5, 0.5], atol = 1e-4)
+np.testing.assert_allclose(utility_A_from_actions(0.5, *ks_solution),
+                           utility_U_from_actions(0.5, *ks_solution), atol = 1e-6)
+
+
+# array kernels should broadcast and agree with the scalar functions
+m_array = np.array([[0.1], [0.5], [0.9]])
+action_A_array = np.array([0., 0.25, 1.])
+action_U_array = 0.75
+nash_array = nash_welfare_function_array(m_array, action_A_array, action_U_array, 1., 2.)
+assert nash_array.shape == (3, 3)
+for i, m in enumerate(m_array[:, 0]):
+    for j, action_A in enumerate(action_A_array):
+        np.testing.assert_almost_equal(
+            nash_array[i, j],
+            nash_welfare_function(m, action_A, action_U_array, 1., 2.))
+np.testing.assert_array_equal(specialLog_array([0., 0.5, 1., 100.]), [0., 0., 0., 2.])
+for x in [0., 0.5, 1., 1e-22, 100., 1e22]:
+    assert specialLog(x) == specialLog_array(x)
+for m in [0.1, 0.5, 0.9]:
+    for action_A, action_U in [(0., 0.), (1e-23, 0.3), (0.25, 0.75), (1., 1.)]:
+        for scalar_function, array_function in [(utility_A_from_actions, utility_A_from_actions_array),
+                                                (utility_U_from_actions, utility_U_from_actions_array)]:
+            np.testing.assert_allclose(scalar_function(m, action_A, action_U),
+                                       array_function(m, action_A, action_U), rtol = 1e-15)
+        np.testing.assert_allclose(ks_welfare_function(m, action_A, action_U, 1., -2.),
+                                   ks_welfare_function_array(m, action_A, action_U, 1., -2.), rtol = 1e-12)
+        np.testing.assert_allclose(maths._nash_welfare_gradient_scalar(m, action_A, action_U, 1., -2.),
+                                   nash_welfare_gradient(m, action_A, action_U, 1., -2.), rtol = 1e-12)
+        np.testing.assert_allclose(maths._ks_welfare_gradient_scalar(m, action_A, action_U, 1., -2.),
+                                   ks_welfare_gradient(m, action_A, action_U, 1., -2.), rtol = 1e-12)
+
+
+# batched solver should agree with the one-by-one solver
+m_array = np.array([0.2, 0.51, 0.8])
+failure_utility_A_array = np.array([0., 1., -2.])
+failure_utility_U_array = np.array([0., 2., -1.])
+for welfare_function in [nash_welfare_function, ks_welfare_function, unfair_welfare_func]:
+    bargaining_solutions = find_bargaining_solutions(
+        m_array = m_array,
+        welfare_function = welfare_function,
+        bargaining_failure_utility_A_array = failure_utility_A_array,
+        bargaining_failure_utility_U_array = failure_utility_U_array)
+    assert bargaining_solutions.shape == (3, 2)
+    for i, m in enumerate(m_array):
+        bargaining_solution = find_bargaining_solution(
+            m = m,
+            welfare_function = welfare_function,
+            bargaining_failure_utility_A = failure_utility_A_array[i],
+            bargaining_failure_utility_U = failure_utility_U_array[i])
+        np.testing.assert_almost_equal(
+            utility_A_from_actions(m, *bargaining_solutions[i]),
+            utility_A_from_actions(m, *bargaining_solution),
+            decimal = 3)
+
+
+# grid evaluation should match cell by cell evaluation
+m_values = np.array([0.3, 0.6])
+p_values = np.array([0.1, 0.5, 0.9])
+failure_utility_A = lambda m: utility_A_from_actions(m, 1, 0)
+failure_utility_U = lambda m: utility_U_from_actions(m, 1, 0)
+utility_A_grid = expected_utility_A_grid(m_values, p_values, nash_welfare_function,
+                                         failure_utility_A, failure_utility_U)
+assert utility_A_grid.shape == (2, 3)
+for i, m in enumerate(m_values):
+    for j, p in enumerate(p_values):
+        np.testing.assert_almost_equal(
+            utility_A_grid[i, j],
+            expected_utility_A(m, p, nash_welfare_function,
+                               failure_utility_A, failure_utility_U),
+            decimal = 3)
+
+
+# repeated solves should be served from the solution cache,
+# which should never grow beyond its size bound
+clear_solution_cache()
+first_solution = find_bargaining_solution(0.4, nash_welfare_function, 1., 2.)
+second_solution = find_bargaining_solution(0.4 + 1e-15, nash_welfare_function, 1., 2.)
+np.testing.assert_array_equal(first_solution, second_solution)
+assert solution_cache_info()['hits'] == 1
+assert solution_cache_info()['misses'] == 1
+
+import maths
+default_solution_cache_size = maths.solution_cache_size
+maths.solution_cache_size = 2
+for m in [0.1, 0.2, 0.3]:
+    find_bargaining_solution(m, nash_welfare_function, 0., 0.)
+assert solution_cache_info()['size'] == 2
+maths.solution_cache_size = default_solution_cache_size
+
+
+# grids saved to the store should load back unchanged, and only for the same config
+import tempfile
+from store import load_grid, save_grid
+with tempfile.TemporaryDirectory() as store_directory:
+    config = {'N': 10 ** 22, 'welfare_function': 'nash', 'resolution': 2}
+    vals = np.array([[1., 2.], [3., 4.]])
+    save_grid(store_directory, config, vals, [0.1, 0.9], [0.2, 0.8])
+    loaded_vals, loaded_m_values, loaded_p_values = load_grid(store_directory, config)
+    np.testing.assert_array_equal(loaded_vals, vals)
+    np.testing.assert_array_equal(loaded_m_values, [0.1, 0.9])
+    np.testing.assert_array_equal(loaded_p_values, [0.2, 0.8])
+    assert load_grid(store_directory, dict(config, welfare_function = 'ks')) is None
+
+
+# adaptive refinement should reproduce a plane exactly from its coarse grid,
+# and refine around a sign change
+from heatmaps import compute_heatmap_values, compute_heatmap_values_adaptive
+m_values = np.linspace(0.1, 0.9, 17)
+p_values = np.linspace(0.1, 0.9, 17)
+evaluations = []
+def plane_fill_func(m, p):
+    evaluations.append((m, p))
+    return 2 * m + p
+plane_vals = compute_heatmap_values_adaptive(plane_fill_func, m_values, p_values,
+                                             tolerance = 10., initial_step = 8)
+np.testing.assert_almost_equal(plane_vals, compute_heatmap_values(plane_fill_func, m_values, p_values))
+assert len(evaluations) == 9 + 17 * 17
+
+step_fill_func = lambda m, p: np.sign(m - 0.5)
+step_vals = compute_heatmap_values_adaptive(step_fill_func, m_values, p_values)
+np.testing.assert_array_equal(step_vals, compute_heatmap_values(step_fill_func, m_values, p_values))
+
+
+# continuation sweeps should find the same solutions as independent solves,
+# and report iteration counts in the order of m_array
+clear_solution_cache()
+m_array = np.array([0.7, 0.3, 0.5, 0.4])
+bargaining_solutions, iterations = find_bargaining_solutions_continuation(
+    m_array = m_array,
+    welfare_function = nash_welfare_function,
+    bargaining_failure_utility_A_array = 0.,
+    bargaining_failure_utility_U_array = 0.,
+    predictor = True)
+assert iterations.shape == (4,)
+for m, bargaining_solution in zip(m_array, bargaining_solutions):
+    np.testing.assert_almost_equal(bargaining_solution, [0.5, 0.5], decimal = 3)
+
+# a solve warm started from a neighbouring solution should take fewer iterations
+# to the same optimum, & not be mistaken for a cold start by the cache
+failure_utility_A, failure_utility_U = bargaining_failure_utilities[0]
+m = 0.2
+shifted_m = ratio_shifted(m)
+neighbouring_solution = find_bargaining_solution(m, nash_welfare_function, failure_utility_A(m), failure_utility_U(m))
+clear_solution_cache()
+warm_solution, warm_iterations = find_bargaining_solution(shifted_m, nash_welfare_function,
+                                                          failure_utility_A(shifted_m), failure_utility_U(shifted_m),
+                                                          initial_guess = neighbouring_solution, full_output = True)
+cold_solution, cold_iterations = find_bargaining_solution(shifted_m, nash_welfare_function,
+                                                          failure_utility_A(shifted_m), failure_utility_U(shifted_m),
+                                                          full_output = True)
+assert 0 < warm_iterations < cold_iterations
+np.testing.assert_allclose(warm_solution, cold_solution, atol = 1e-5)
+
+
+# exact gradients & hessians should match finite differences
+m, action_A, action_U = 0.3, 0.4, 0.7
+step = 1e-6
+for welfare_function in [nash_welfare_function, ks_welfare_function]:
+    welfare_gradient = welfare_function_gradients[welfare_function]
+    welfare_hessian = welfare_function_hessians[welfare_function]
+    finite_difference_gradient = np.array([
+        welfare_function(m, action_A + step, action_U, 1., 2.) -
+        welfare_function(m, action_A - step, action_U, 1., 2.),
+        welfare_function(m, action_A, action_U + step, 1., 2.) -
+        welfare_function(m, action_A, action_U - step, 1., 2.)]) / (2 * step)
+    finite_difference_hessian = np.array([
+        welfare_gradient(m, action_A + step, action_U, 1., 2.) -
+        welfare_gradient(m, action_A - step, action_U, 1., 2.),
+        welfare_gradient(m, action_A, action_U + step, 1., 2.) -
+        welfare_gradient(m, action_A, action_U - step, 1., 2.)]) / (2 * step)
+    np.testing.assert_allclose(welfare_gradient(m, action_A, action_U, 1., 2.),
+                               finite_difference_gradient, rtol = 1e-5)
+    np.testing.assert_allclose(welfare_hessian(m, action_A, action_U, 1., 2.),
+                               finite_difference_hessian, rtol = 1e-5)
+
+
+# analytic solutions should agree with the numeric solver for nash,
+# and fall back to it when there is no frontier point where both teams gain
+for m in [0.2, 0.5, 0.8]:
+    failure_utility_A = utility_A_from_actions(m, 1, 0)
+    failure_utility_U = utility_U_from_actions(m, 1, 0)
+    analytic_solution = find_bargaining_solution(m, nash_welfare_function,
+                                                 failure_utility_A, failure_utility_U,
+                                                 solver = 'analytic')
+    numeric_solution = find_bargaining_solution(m, nash_welfare_function,
+                                                failure_utility_A, failure_utility_U,
+                                                solver = 'numeric')
+    np.testing.assert_almost_equal(utility_A_from_actions(m, *analytic_solution),
+                                   utility_A_from_actions(m, *numeric_solution),
+                                   decimal = 3)
+
+analytic_solutions, solved = analytic_bargaining_solutions([0.3, 0.3], ks_welfare_function,
+                                                           [0., 30.], [0., 0.])
+np.testing.assert_almost_equal(analytic_solutions[0], [0.5, 0.5])
+assert list(solved) == [True, False]
+np.testing.assert_array_equal(
+    find_bargaining_solution(0.3, unfair_welfare_func, 0., 0., solver = 'analytic'),
+    find_bargaining_solution(0.3, unfair_welfare_func, 0., 0., solver = 'numeric'))
+
+
+# instrumentation should count solves, welfare evaluations & cache hits,
+# and surface unconverged batched solves in the heatmap cells using them
+from functools import partial
+assert instrumentation_stats() is None
+clear_solution_cache()
+with instrumentation() as stats:
+    find_bargaining_solution(0.3, nash_welfare_function, 0., 0.)
+    find_bargaining_solution(0.3, nash_welfare_function, 0., 0.)
+assert instrumentation_stats() is None
+assert stats['solves']['numeric'] == 1
+assert stats['solves']['cached'] == 1
+assert stats['solves']['objective_evaluations'] == \
+    stats['welfare_functions']['nash_welfare_function']['calls'] > 0
+
+default_batch_max_rounds = maths.batch_max_rounds
+maths.batch_max_rounds = 1
+clear_solution_cache()
+m_values = np.array([0.2, 0.8])
+p_values = np.array([0.1, 0.5, 0.9])
+grid_fill_func = partial(log_quantity,
+                         quantity_function = expected_utility_A_grid,
+                         welfare_function = nash_welfare_function,
+                         bargaining_failure_utility_A = zero_failure_utility,
+                         bargaining_failure_utility_U = zero_failure_utility)
+with instrumentation() as stats:
+    compute_heatmap_values(grid_fill_func, m_values, p_values, vectorized = True)
+assert stats['solves']['batched'] == 2
+assert len(stats['unconverged_problems']) == 2
+assert np.all(stats['heatmaps'][-1]['unconverged'] > 0)
+maths.batch_max_rounds = default_batch_max_rounds
+clear_solution_cache()
+
+
+# streaming fills should resume from a checkpoint without recomputing
+# finished cells, and give the same grid as compute_heatmap_values
+from heatmaps import compute_heatmap_values_streaming
+import os
+from store import config_key, finish_checkpoint, open_checkpoint
+m_values = np.linspace(0.1, 0.9, 5)
+p_values = np.linspace(0.1, 0.9, 4)
+with tempfile.TemporaryDirectory() as store_directory:
+    config = {'fill_func': 'plane', 'resolution': 5}
+    vals, done = open_checkpoint(store_directory, config, m_values, p_values)
+    evaluations = []
+    for row in compute_heatmap_values_streaming(plane_fill_func, m_values, p_values, vals, done):
+        if row == 1:
+            break # interrupted after 2 rows
+    del vals, done
+    assert finish_checkpoint(store_directory, config) is None
+
+    vals, done = open_checkpoint(store_directory, config, m_values, p_values)
+    assert done.sum() == 2 * 4
+    evaluations = []
+    assert list(compute_heatmap_values_streaming(plane_fill_func, m_values, p_values, vals, done)) == [2, 3, 4]
+    assert len(evaluations) == 3 * 4
+    del vals, done
+    loaded_vals, _, _ = finish_checkpoint(store_directory, config)
+    np.testing.assert_almost_equal(loaded_vals, compute_heatmap_values(plane_fill_func, m_values, p_values))
+    assert load_grid(store_directory, config) is not None
+
+    # a checkpoint left without its axes is started afresh
+    config = {'fill_func': 'plane', 'resolution': 5, 'interrupted': True}
+    vals, done = open_checkpoint(store_directory, config, m_values, p_values)
+    done[0] = True
+    del vals, done
+    os.remove(os.path.join(store_directory, config_key(config) + '_axes.npz'))
+    vals, done = open_checkpoint(store_directory, config, m_values, p_values)
+    assert not np.any(done)
+    del vals, done
+
+
+# a sweep should solve each problem its configs share once,
+# and give the same grids as the grid quantity functions
+import heatmaps
+import sweep
+default_resolution = heatmaps.resolution
+heatmaps.resolution = 3
+clear_solution_cache()
+configs = sweep.sweep_configs(welfare_function_names = ['nash'],
+                              disagreement_outcomes = [1],
+                              quantity_names = ['expected_utility_A', 'expected_utility_A_max_shift'])
+with instrumentation() as stats:
+    grids = sweep.run_sweep(configs)
+assert stats['solves']['batched'] == 2 * 3 # each m & each shifted m
+m_values = heatmaps.default_m_values(heatmaps.min_m_ratio, heatmaps.max_m_ratio)
+p_values = heatmaps.default_p_values(heatmaps.min_p, heatmaps.max_p)
+np.testing.assert_allclose(grids[1], log_quantity(m_values, p_values, expected_utility_A_max_shift_grid,
+                                                  nash_welfare_function,
+                                                  *bargaining_failure_utilities[1]))
+
+# configs with different solver settings should be stored under different keys,
+# & run_sweep should solve each with its own settings
+analytic_configs = [dict(config, solver_settings = dict(config['solver_settings'], batch_method = 'analytic'))
+                    for config in configs]
+assert config_key(analytic_configs[0]) != config_key(configs[0])
+for name, value in [('analytic_bisection_steps', 32), ('frontier_polish_half_width', 0.1)]:
+    assert config_key(dict(configs[0], solver_settings = dict(configs[0]['solver_settings'], **{name: value}))) != \
+        config_key(configs[0])
+with instrumentation() as stats:
+    analytic_grids = sweep.run_sweep(analytic_configs)
+assert stats['solves']['analytic'] == 2 * 3 and maths.batch_method == 'grid_search'
+np.testing.assert_allclose(analytic_grids[1], grids[1], rtol = 1e-6)
+heatmaps.resolution = default_resolution
+
+
+# surfaces should broadcast & match the grids, and derivatives should
+# match the finite differences divided by delta for small delta
+m_values = np.array([0.2, 0.5, 0.7])
+p_values = np.array([0.1, 0.6])
+failure_utility_A, failure_utility_U = bargaining_failure_utilities[0]
+np.testing.assert_allclose(
+    expected_utility_A_surface(m_values[:, None], p_values[None, :], nash_welfare_function,
+                               failure_utility_A, failure_utility_U),
+    expected_utility_A_grid(m_values, p_values, nash_welfare_function,
+                            failure_utility_A, failure_utility_U))
+shift_m, shift_p = expected_utility_A_sensitivities(m_values, 0.3, nash_welfare_function,
+                                                    failure_utility_A, failure_utility_U)
+assert shift_m.shape == shift_p.shape == (3,)
+for m, m_shift, p_shift in zip(m_values, shift_m, shift_p):
+    np.testing.assert_almost_equal(m_shift, expected_utility_A_delta_m(m, 0.3, nash_welfare_function,
+                                                                       failure_utility_A, failure_utility_U),
+                                   decimal = 3)
+    np.testing.assert_almost_equal(p_shift, expected_utility_A_delta_p(m, 0.3, nash_welfare_function,
+                                                                       failure_utility_A, failure_utility_U))
+
+default_delta = maths.delta
+maths.delta = 1e-5
+shift_m, shift_p = expected_utility_A_sensitivities(m_values, 0.3, nash_welfare_function,
+                                                    failure_utility_A, failure_utility_U)
+derivative_m, derivative_p = expected_utility_A_sensitivities(m_values, 0.3, nash_welfare_function,
+                                                              failure_utility_A, failure_utility_U,
+                                                              derivatives = True)
+np.testing.assert_allclose(derivative_m, shift_m / maths.delta, rtol = 1e-3)
+np.testing.assert_allclose(derivative_p, shift_p / maths.delta, rtol = 1e-3)
+maths.delta = default_delta
+
+
+# multi-start solves should never find lower welfare than a single start,
+# & start from the requested number of points in [0, 1]^2
+for m in np.linspace(0.02, 0.98, 9):
+    single_start_solution = find_bargaining_solution(m, ks_welfare_function, 0., 0., solver = 'numeric')
+    multistart_solution = find_bargaining_solution(m, ks_welfare_function, 0., 0., solver = 'multistart')
+    assert ks_welfare_function(m, *multistart_solution, 0., 0.) >= \
+        ks_welfare_function(m, *single_start_solution, 0., 0.) - 1e-9
+for seeds in ['grid', 'sobol', 'lhs']:
+    initial_guesses = multistart_initial_guesses(0.3, nash_welfare_function, 0., 0., restarts = 5, seeds = seeds)
+    assert initial_guesses.shape == (5, 2)
+    assert np.all((0 <= initial_guesses) & (initial_guesses <= 1))
+
+# grid seeds should sit apart, not around one peak of the prescan
+failure_utility_A, failure_utility_U = bargaining_failure_utilities[2]
+initial_guesses = multistart_initial_guesses(0.3, nash_welfare_function, failure_utility_A(0.3), failure_utility_U(0.3))
+separations = np.max(np.abs(initial_guesses[:, None] - initial_guesses[None, :]), axis = 2)
+assert np.all(separations[np.triu_indices(len(initial_guesses), 1)] >=
+              maths.multistart_seed_separation / (maths.multistart_prescan_points - 1))
+
+# restarts run on workers should be counted like those run here
+failure_utility_A, failure_utility_U = bargaining_failure_utilities[1]
+retries = []
+for workers in [1, 2]:
+    maths.multistart_workers = workers
+    clear_solution_cache()
+    with instrumentation() as stats:
+        find_bargaining_solution(0.01, ks_welfare_function, 0., 0., solver = 'multistart')
+    retries.append(stats['solves']['finite_difference_retries'])
+# & solve under the current N, not the one the workers were started with
+failure_utility_A, failure_utility_U = bargaining_failure_utilities[0]
+default_N = maths.N
+maths.N = 10 ** 4
+np.testing.assert_allclose(find_bargaining_solution(0.3, nash_welfare_function, failure_utility_A(0.3),
+                                                    failure_utility_U(0.3), solver = 'multistart'),
+                           find_bargaining_solution(0.3, nash_welfare_function, failure_utility_A(0.3),
+                                                    failure_utility_U(0.3), solver = 'numeric'), atol = 1e-4)
+maths.N = default_N
+maths.multistart_workers = 1
+assert retries[0] == retries[1] > 0
+
+
+# the pareto frontier index should give the ks ideal point, the analytic nash
+# solutions & the corner solution for an unfair welfare function
+np.testing.assert_allclose(frontier_ideal_point(), ks_ideal_point(0.3))
+m_values = np.array([0.1, 0.5, 0.9])
+for failure_utility_A, failure_utility_U in bargaining_failure_utilities.values():
+    frontier_solutions, solved = frontier_bargaining_solutions(m_values, nash_welfare_function,
+                                                               [failure_utility_A(m) for m in m_values],
+                                                               [failure_utility_U(m) for m in m_values])
+    analytic_solutions, _ = analytic_bargaining_solutions(m_values, nash_welfare_function,
+                                                          [failure_utility_A(m) for m in m_values],
+                                                          [failure_utility_U(m) for m in m_values])
+    assert np.all(solved)
+    np.testing.assert_allclose(frontier_solutions, analytic_solutions, atol = 1e-6)
+np.testing.assert_allclose(find_bargaining_solution(0.3, unfair_welfare_func, 0., 0., solver = 'frontier'), [1, 1])
+# no frontier point beats failure utilities this high, so nothing is solved & the frontier solver falls back
+frontier_solutions, solved = frontier_bargaining_solutions(m_values, nash_welfare_function, 30., 30.)
+assert not np.any(solved) and np.all(np.isnan(frontier_solutions))
+assert np.all(np.isfinite(find_bargaining_solution(0.3, nash_welfare_function, 30., 30., solver = 'frontier')))
+# the ks penalty isn't maximized on the frontier in general, its polished maxima are at least as good as the grid search's
+for failure_utility_A, failure_utility_U in bargaining_failure_utilities.values():
+    failure_utilities = ([failure_utility_A(m) for m in m_values], [failure_utility_U(m) for m in m_values])
+    frontier_solutions, solved = frontier_bargaining_solutions(m_values, ks_welfare_function, *failure_utilities)
+    grid_solutions = find_bargaining_solutions(m_values, ks_welfare_function, *failure_utilities)
+    assert np.all(solved)
+    assert np.all(ks_welfare_function_array(m_values, *frontier_solutions.T, *failure_utilities) >=
+                  ks_welfare_function_array(m_values, *grid_solutions.T, *failure_utilities) - 1e-9)
+
+
+# heatmaps are drawn without pyplot, with at most max_tick_labels labels per axis,
+# & saved as one pixel per cell when direct_image
+assert len(heatmaps._thinned_ticks(4000)) <= heatmaps.max_tick_labels
+assert heatmaps._thinned_ticks(4000)[-1] == 3999
+m_values = np.linspace(0.1, 0.9, 50)
+p_values = np.linspace(0.1, 0.9, 40)
+vals = np.log(np.outer(m_values, p_values))
+with tempfile.TemporaryDirectory() as image_directory:
+    heatmaps.plot_heatmap(vals, m_values, p_values, 'sequential', 'test',
+                          file_name = os.path.join(image_directory, 'figure.png'))
+    heatmaps.direct_image = True
+    heatmaps.plot_heatmap(vals, m_values, p_values, 'sequential', 'test',
+                          file_name = os.path.join(image_directory, 'image.png'))
+    heatmaps.direct_image = False
+    from matplotlib.image import imread
+    assert imread(os.path.join(image_directory, 'image.png')).shape == (50, 40, 4)
+import matplotlib.pyplot as plt
+assert not plt.get_fignums()
+
+
+# the server should compute the same grids as run_sweep, solving each problem once for all clients
+import asyncio
+import threading
+import server
+server_loop = asyncio.new_event_loop()
+running_server = server_loop.run_until_complete(server.start_server('127.0.0.1:0', workers = 1))
+server_address = f'127.0.0.1:{running_server.sockets[0].getsockname()[1]}'
+threading.Thread(target = server_loop.run_forever, daemon = True).start()
+
+heatmaps.resolution = 4
+configs = sweep.sweep_configs(welfare_function_names = ['nash'], disagreement_outcomes = [1],
+                              quantity_names = ['expected_utility_A', 'expected_utility_A_max_shift'])
+for served_grid, grid in zip(server.request_sweep(configs, server_address), sweep.run_sweep(configs)):
+    np.testing.assert_allclose(served_grid, grid)
+vals = np.full((4, 4), np.nan)
+done = np.zeros((4, 4), dtype = bool)
+done[1] = True
+assert sorted(server.request_heatmap_values(configs[1], vals, done, server_address)) == [0, 2, 3]
+assert np.all(done) and np.all(np.isnan(vals[1]))
+# rows served into a checkpoint should resume like those computed locally
+with tempfile.TemporaryDirectory() as store_directory:
+    vals, done = open_checkpoint(store_directory, configs[1], *sweep._axes(configs[1]))
+    assert sorted(server.request_heatmap_values(configs[1], vals, done, server_address)) == [0, 1, 2, 3]
+    del vals, done
+    loaded_vals, _, _ = finish_checkpoint(store_directory, configs[1])
+    np.testing.assert_allclose(loaded_vals, sweep.run_sweep(configs)[1])
+rows = server.request_rows({'job': 'sweep', 'configs': configs}, server_address)
+try:
+    while True:
+        next(rows)
+except StopIteration as finished:
+    assert finished.value['solved'] == 0
+# failure utilities depend on N, so must be computed under the config's N
+configs = sweep.sweep_configs(N_values = [10 ** 10], welfare_function_names = ['nash'], disagreement_outcomes = [0],
+                              quantity_names = ['expected_utility_A'])
+for served_grid, grid in zip(server.request_sweep(configs, server_address), sweep.run_sweep(configs)):
+    np.testing.assert_allclose(served_grid, grid)
+heatmaps.resolution = default_resolution
+server_loop.call_soon_threadsafe(server_loop.stop)
+
+
+# with no uncertainty monte carlo estimates should be the point values, & with
+# uncertainty their means should agree with plain sampling within their standard errors
+m_values = np.array([0.2, 0.6])
+p_values = np.array([0.3, 0.8])
+failure_utility_A, failure_utility_U = bargaining_failure_utilities[1]
+default_m_bin_width = maths.monte_carlo_m_bin_width
+maths.monte_carlo_m_bin_width = 0
+estimates = expected_utility_A_uncertain(m_values, p_values, nash_welfare_function,
+                                         failure_utility_A, failure_utility_U, m_spread = 0, p_spread = 0)
+maths.monte_carlo_m_bin_width = default_m_bin_width
+point_values = expected_utility_A_grid(m_values, p_values, nash_welfare_function,
+                                       failure_utility_A, failure_utility_U)
+np.testing.assert_allclose(estimates['mean'], point_values)
+np.testing.assert_allclose(estimates['quantiles'], np.broadcast_to(point_values, (3, 2, 2)))
+assert np.all(estimates['converged']) and np.all(estimates['samples'] == maths.monte_carlo_batch_size)
+
+estimates = expected_utility_A_uncertain(m_values, p_values, nash_welfare_function,
+                                         failure_utility_A, failure_utility_U)
+assert np.all(estimates['samples'] <= maths.monte_carlo_max_samples)
+assert np.all(np.diff(estimates['quantiles'], axis = 0) >= 0)
+random_generator = np.random.default_rng(1)
+m_draws, p_draws = random_generator.standard_normal((2, 4000))
+sampled_m = ratio_scaled(m_values[0], np.exp(maths.monte_carlo_m_spread * m_draws))
+sampled_p = ratio_scaled(p_values[1], np.exp(maths.monte_carlo_p_spread * p_draws))
+sampled_values = expected_utility_A_surface(sampled_m, sampled_p, nash_welfare_function,
+                                            failure_utility_A, failure_utility_U)
+standard_error = np.sqrt(estimates['variance'][0, 1] / estimates['samples'][0, 1] + np.var(sampled_values) / 4000)
+assert abs(estimates['mean'][0, 1] - np.mean(sampled_values)) < 4 * standard_error